@@ -0,0 +1,178 @@
+"""Admission control for LLM generation.
+
+At most ``max_inflight`` generations run at once. Further requests wait in
+per-user queues that are served round-robin, so one busy user cannot starve
+the rest; within a user's queue the earliest deadline goes first. Requests
+are turned away immediately, instead of queueing into a timeout, when:
+
+* the user already has ``max_queued_per_user`` requests waiting (429), or
+* the predicted wait (queue length / slots x average generation time)
+  exceeds ``max_wait_seconds`` or the request's own deadline (503).
+
+Rejections carry a ``retry_after`` estimate for the Retry-After header.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class _Waiter:
+    __slots__ = ("future", "deadline")
+
+    def __init__(self, future: asyncio.Future, deadline: Optional[float]):
+        self.future = future
+        self.deadline = deadline
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int,
+        max_queue: int,
+        max_queued_per_user: int,
+        max_wait_seconds: float,
+        initial_service_seconds: float
+    ):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait_seconds = max_wait_seconds
+        self.inflight = 0
+        self.service_seconds = initial_service_seconds
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._turns: Deque[str] = deque()
+        self.counters = {"admitted": 0, "enqueued": 0, "rejected_user_limit": 0, "rejected_overload": 0, "expired": 0}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def predicted_wait(self) -> float:
+        """Seconds a request arriving now is expected to wait for a slot"""
+        if self.inflight < self.max_inflight and not self.queued:
+            return 0.0
+        return (self.queued + 1) / self.max_inflight * self.service_seconds
+
+    def check(self, user_id: str):
+        """Raise AdmissionRejected(429) if the user already has a full queue"""
+        if len(self._queues.get(user_id, ())) >= self.max_queued_per_user:
+            self.counters["rejected_user_limit"] += 1
+            raise AdmissionRejected(429, self.predicted_wait(), "Too many requests from this user are already waiting")
+
+    async def acquire(self, user_id: str, deadline: Optional[float] = None, shed: bool = True):
+        """Wait for a generation slot.
+
+        deadline is a time.monotonic() value. With shed=False the request
+        always queues (used for batch work that has no one waiting on it).
+        """
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            self.counters["admitted"] += 1
+            return
+
+        wait = self.predicted_wait()
+        if shed:
+            self.check(user_id)
+            late = deadline is not None and time.monotonic() + wait > deadline
+            if self.queued >= self.max_queue or wait > self.max_wait_seconds or late:
+                self.counters["rejected_overload"] += 1
+                raise AdmissionRejected(503, wait, "Answer generation is at capacity")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, deadline)
+        if user_id not in self._queues:
+            self._queues[user_id] = deque()
+            self._turns.append(user_id)
+        self._queues[user_id].append(waiter)
+        self.counters["enqueued"] += 1
+
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as this request gave up
+                self.release(None)
+            else:
+                self._discard(user_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["expired"] += 1
+                raise AdmissionRejected(503, self.predicted_wait(), "Deadline passed while waiting for generation capacity")
+            raise
+        self.counters["admitted"] += 1
+
+    def release(self, service_seconds: Optional[float]):
+        self.inflight -= 1
+        if service_seconds is not None:
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * service_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, deadline: Optional[float] = None, shed: bool = True):
+        await self.acquire(user_id, deadline, shed)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queued": self.queued,
+            "predicted_wait_seconds": round(self.predicted_wait(), 3),
+            "average_generation_seconds": round(self.service_seconds, 3),
+            **self.counters
+        }
+
+    def _discard(self, user_id: str, waiter: _Waiter):
+        queue = self._queues.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user_id]
+                self._turns.remove(user_id)
+
+    def _dispatch(self):
+        """Hand free slots to waiting users in round-robin order, earliest deadline first per user"""
+        now = time.monotonic()
+        skipped = 0
+        while self.inflight < self.max_inflight and skipped < len(self._turns):
+            user_id = self._turns[0]
+            self._turns.rotate(-1)
+            queue = self._queues[user_id]
+
+            live = [
+                waiter for waiter in queue
+                if not waiter.future.done() and (waiter.deadline is None or waiter.deadline > now)
+            ]
+            if not live:
+                # Cancelled and expired waiters remove themselves when they wake up
+                skipped += 1
+                continue
+            skipped = 0
+
+            waiter = min(live, key=lambda w: math.inf if w.deadline is None else w.deadline)
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user_id]
+                self._turns.remove(user_id)
+
+            self.inflight += 1
+            waiter.future.set_result(None)
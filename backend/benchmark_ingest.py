@@ -0,0 +1,132 @@
+"""Benchmark PDF ingestion over a sample set of PDFs.
+
+For every installed extractor the PDFs are parsed once with an empty cache
+(cold) and once more with the cache populated by that run (warm), reporting
+pages per second and MB per second for both.
+
+With --chunkers every chunker is compared on chunk count, chunk size, text
+duplication (chunk characters over source characters) and on-disk index
+size. Adding --questions (a labelled JSONL as used by evaluate_retrieval.py)
+also reports retrieval precision, recall and MRR for each chunker.
+
+With --embedding the chunks are embedded with the multi-process embedding
+pool at each --workers count, reporting chunks per second and the speed-up
+over a single worker.
+
+Usage:
+    python benchmark_ingest.py sample_pdfs/
+    python benchmark_ingest.py sample_pdfs/ --extractor pypdf --extractor pymupdf
+    python benchmark_ingest.py sample_pdfs/ --chunkers --questions questions.jsonl
+    python benchmark_ingest.py sample_pdfs/ --embedding --workers 1 2 4 8 --batch-size 256
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import ingest
+import vector_store
+from embedding_pool import EMBED_BATCH_SIZE, EmbeddingPool
+
+
+def run_extraction(paths, extractor, use_cache=True):
+    started = time.perf_counter()
+    pages = sum(len(ingest.extract_pdf(path, extractor, use_cache)["pages"]) for path in paths)
+    return pages, time.perf_counter() - started
+
+
+def compare_chunkers(paths, questions_path=None, one_based_pages=False, k=3):
+    import bhararth1
+    from evaluate_retrieval import evaluate, load_questions
+
+    documents = ingest.load_documents(paths)
+    source_chars = sum(len(document.page_content) for document in documents)
+    questions = load_questions(questions_path, one_based_pages) if questions_path else None
+    embedder = bhararth1.load_embeddings()
+
+    print(f"{'chunker':<12}{'chunks':>8}{'mean chars':>12}{'duplication':>13}{'index KB':>10}"
+          + (f"{'precision':>11}{'recall':>8}{'mrr':>8}" if questions else ""))
+    with tempfile.TemporaryDirectory() as collections_dir:
+        vector_store.COLLECTIONS_DIR = Path(collections_dir)
+        for chunker in ingest.CHUNKERS:
+            chunks = ingest.split_documents(documents, chunker)
+            texts = [chunk.page_content for chunk in chunks]
+            embeddings = np.asarray(embedder.encode(texts, convert_to_numpy=True), dtype="float32")
+
+            collection = vector_store.get_collection(f"benchmark_{chunker}")
+            collection.write(texts, [chunk.metadata for chunk in chunks], embeddings, bhararth1.EMBEDDING_MODEL)
+            index_bytes = sum(path.stat().st_size for path in collection.current_path.iterdir())
+
+            chunk_chars = sum(len(text) for text in texts)
+            row = (f"{chunker:<12}{len(chunks):>8}{chunk_chars / max(len(chunks), 1):>12.0f}"
+                   f"{chunk_chars / max(source_chars, 1):>13.2f}{index_bytes / 1024:>10.1f}")
+            if questions:
+                metrics = evaluate(questions, {"collections": [collection.name], "k": k})["metrics"]
+                row += f"{metrics['precision_at_k']:>11.3f}{metrics['recall_at_k']:>8.3f}{metrics['mrr']:>8.3f}"
+            print(row)
+
+
+def compare_embedding_workers(paths, worker_counts, batch_size, repeat=1):
+    import bhararth1
+
+    chunks = ingest.split_documents(ingest.load_documents(paths))
+    texts = [chunk.page_content for chunk in chunks] * repeat
+    print(f"{len(texts)} chunks, batch size {batch_size}")
+    print(f"{'workers':>8}{'seconds':>10}{'chunks/s':>10}{'speed-up':>10}")
+    baseline = None
+    for workers in worker_counts:
+        pool = EmbeddingPool(bhararth1.EMBEDDING_MODEL, workers, batch_size)
+        try:
+            # The first call starts the workers and loads the model; time the second
+            pool.encode(texts[:batch_size])
+            pool.encode(texts)
+        finally:
+            pool.shutdown()
+        rate = pool.last_run["chunks_per_second"]
+        baseline = baseline or rate
+        print(f"{workers:>8}{pool.last_run['seconds']:>10.3f}{rate:>10.1f}{rate / baseline:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction and the parsed-page cache")
+    parser.add_argument("pdf_dir", help="directory of sample PDFs")
+    parser.add_argument("--extractor", action="append", default=[],
+                        help="extractor to benchmark; defaults to every installed extractor")
+    parser.add_argument("--chunkers", action="store_true", help="compare the chunkers instead of the extractors")
+    parser.add_argument("--questions", help="labelled questions for the chunker retrieval comparison")
+    parser.add_argument("--one-based-pages", action="store_true", help="expected pages are numbered from 1")
+    parser.add_argument("-k", type=int, default=3, help="chunks retrieved per question")
+    parser.add_argument("--embedding", action="store_true", help="benchmark the multi-process embedding pool")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts for --embedding")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="texts per worker task for --embedding")
+    parser.add_argument("--repeat", type=int, default=1, help="repeat the chunks N times for a larger --embedding run")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    if not paths:
+        parser.error(f"no PDFs found in {args.pdf_dir}")
+    if args.chunkers:
+        compare_chunkers(paths, args.questions, args.one_based_pages, args.k)
+        return
+    if args.embedding:
+        compare_embedding_workers(paths, args.workers, args.batch_size, args.repeat)
+        return
+    megabytes = sum(path.stat().st_size for path in paths) / 1e6
+    extractors = args.extractor or ingest.available_extractors()
+
+    print(f"{len(paths)} PDFs, {megabytes:.1f} MB")
+    print(f"{'extractor':<12}{'phase':<8}{'pages':>8}{'seconds':>10}{'pages/s':>10}{'MB/s':>10}")
+    for extractor in extractors:
+        # Each extractor gets its own empty cache so the cold run really parses
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ingest.PDF_CACHE_DIR = Path(cache_dir)
+            for phase in ("cold", "warm"):
+                pages, seconds = run_extraction(paths, extractor)
+                print(f"{extractor:<12}{phase:<8}{pages:>8}{seconds:>10.3f}"
+                      f"{pages / seconds:>10.1f}{megabytes / seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
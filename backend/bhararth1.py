@@ -1,41 +1,113 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, File, Form, Header, UploadFile, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import os
+import hashlib
+import hmac
+import asyncio
 import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Awaitable, Callable, Iterator, Literal, Optional
 import numpy as np
-import faiss
 import shutil
 from datetime import datetime
 import json
 import uuid
 from dotenv import load_dotenv
 
+from admission import AdmissionController, AdmissionRejected
+from coalesce import SingleFlight, normalize_question
+from diversify import DEFAULT_DIVERSITY, MAX_DISTANCE_RATIO, MMR_CANDIDATES, MMR_LAMBDA, Diversity
+from embedding_pool import embed_documents, shutdown_embedding_pool
+from ingest import CHUNKERS, load_documents, select_extractor, split_documents
+from intent_router import INTENT_ROUTER_ENABLED, LOCAL_REPLIES, IntentRouter
+from metadata_index import SearchFilters
+from precomputed import PRECOMPUTED_ANSWERS_ENABLED, PrecomputedAnswers, log_question
+from profiling import PROFILE_MODES, TraceMiddleware, capture_profile, current_trace, mark_handler_done, stage, trace_timings
+from session_journal import SESSION_JOURNAL_ENABLED, SessionJournal
+from vector_store import (
+    DEFAULT_COLLECTION,
+    INDEX_ENCODINGS,
+    Collection,
+    find_collection,
+    get_collection,
+    list_collections,
+    read_manifest,
+    resolve_chunks,
+    search_collections,
+)
+from watson_pool import WATSON_POOL_SIZE, WATSON_POOL_USER_ID, WATSON_SESSION_MAX_AGE, WatsonSessionPool
+
 # Load environment variables
 load_dotenv()
 
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from ibm_watsonx_ai.foundation_models import Model
+# Heavy dependencies (sentence_transformers/torch, langchain, faiss and the IBM
+# SDKs) are imported inside the functions that need them, so importing this
+# module is fast. Clients and models are created by warm_up() in the background
+# once the server is accepting connections.
 
-app = FastAPI(title="Legal RAG Navigator API - Watson Flow with Processing Detection")
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+GENERATION_DEFAULT_DEADLINE_SECONDS = float(os.getenv('GENERATION_DEADLINE_SECONDS', '30'))
+# Follow-up turns: how much conversation is sent to Watson, and how fast
+# earlier turns fade from the session's retrieval vector
+CONTEXT_MAX_TURNS = int(os.getenv('CONTEXT_MAX_TURNS', '4'))
+CONTEXT_MAX_CHARS = int(os.getenv('CONTEXT_MAX_CHARS', '1000'))
+QUERY_VECTOR_DECAY = float(os.getenv('QUERY_VECTOR_DECAY', '0.5'))
+# /admin endpoints require this in the X-Admin-Token header, and are disabled when it is unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# /ws/chat: seconds between server pings, and events buffered per connection
+# before answer generation waits for the client to catch up
+WS_HEARTBEAT_SECONDS = float(os.getenv('WS_HEARTBEAT_SECONDS', '20'))
+WS_SEND_QUEUE_SIZE = int(os.getenv('WS_SEND_QUEUE_SIZE', '64'))
 
-# Watson Assistant integration
-try:
-    from ibm_watson import AssistantV2
-    from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
-    WATSON_ASSISTANT_AVAILABLE = True
-except ImportError:
-    WATSON_ASSISTANT_AVAILABLE = False
+# Bounds the watsonx.ai generations in flight; see admission.py
+generation_admission = AdmissionController(
+    max_inflight=int(os.getenv('GENERATION_MAX_INFLIGHT', '4')),
+    max_queue=int(os.getenv('GENERATION_MAX_QUEUE', '32')),
+    max_queued_per_user=int(os.getenv('GENERATION_MAX_QUEUED_PER_USER', '2')),
+    max_wait_seconds=float(os.getenv('GENERATION_MAX_WAIT_SECONDS', '10')),
+    initial_service_seconds=float(os.getenv('GENERATION_EXPECTED_SECONDS', '3'))
+)
 
-# Store active sessions with conversation context
+# Store active sessions with conversation context; every change is also
+# journaled so the sessions survive a restart
 active_sessions = {}
+session_journal = SessionJournal()
+
+# Populated by warm_up()
+watson_assistant = None
+watson_pool = None
+llm_model = None
+simplification_model = None
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+_intent_router = None
+
+# Answers for frequent questions built offline by precompute_answers.py
+precomputed_answers = PrecomputedAnswers()
+
+startup_state = {
+    "started_at": datetime.now().isoformat(),
+    "ready": False,
+    "components": {}
+}
 
 def init_watson_assistant():
-    if not WATSON_ASSISTANT_AVAILABLE:
+    if not os.getenv('WATSON_API_KEY'):
+        print("⚠ Watson Assistant disabled: WATSON_API_KEY is not set")
+        return None
+    
+    try:
+        from ibm_watson import AssistantV2
+        from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+    except ImportError:
         return None
     
     try:
@@ -59,84 +131,408 @@ def init_watson_assistant():
         return None
 
 def load_embeddings():
-    return SentenceTransformer('all-MiniLM-L6-v2')
+    """Return the shared sentence embedder, loading it on first use"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedder
+
+def install_index_bundles():
+    """Install the prebuilt bundles listed in INDEX_BUNDLES ("name=path" or
+    "path", comma separated) and load their collections"""
+    installed = []
+    for entry in filter(None, (item.strip() for item in os.getenv('INDEX_BUNDLES', '').split(','))):
+        name, _, path = entry.rpartition('=')
+        try:
+            manifest = read_manifest(Path(path))
+            name = name or manifest.get("collection") or DEFAULT_COLLECTION
+            if manifest["embedding_model"] != EMBEDDING_MODEL:
+                print(f"⚠ Skipping bundle {path}: built with {manifest['embedding_model']}, serving {EMBEDDING_MODEL}")
+                continue
+            collection = get_collection(name)
+            version = collection.install_bundle(Path(path))
+            if version:
+                print(f"Installed bundle {path} as collection '{name}' version {version}")
+            collection.load()
+            installed.append(name)
+        except ValueError as e:
+            print(f"⚠ Skipping bundle {path}: {e}")
+    return installed or None
+
+def get_intent_router():
+    """Return the local intent router, embedding its exemplars on first use"""
+    global _intent_router
+    if _intent_router is None:
+        _intent_router = IntentRouter(load_embeddings())
+    return _intent_router
+
+def _watsonx_model(params):
+    if not os.getenv('WATSONX_API_KEY'):
+        return None
+    
+    from ibm_watsonx_ai.foundation_models import Model
+    return Model(
+        model_id=os.getenv('MODEL_ID', 'ibm/granite-3-8b-instruct'),
+        credentials={
+            'apikey': os.getenv('WATSONX_API_KEY'), 
+            'url': os.getenv('WATSONX_URL')
+        },
+        project_id=os.getenv('WATSONX_PROJECT_ID'),
+        params=params
+    )
 
 def init_llm():
     try:
-        model = Model(
-            model_id=os.getenv('MODEL_ID', 'ibm/granite-3-8b-instruct'),
-            credentials={
-                'apikey': os.getenv('WATSONX_API_KEY'), 
-                'url': os.getenv('WATSONX_URL')
-            },
-            project_id=os.getenv('WATSONX_PROJECT_ID'),
-            params={
-                "max_new_tokens": 500,
-                "temperature": 0.7,
-                "decoding_method": "greedy"
-            }
-        )
-        return model
+        return _watsonx_model({
+            "max_new_tokens": 500,
+            "temperature": 0.7,
+            "decoding_method": "greedy"
+        })
     except Exception as e:
         print(f"IBM Watsonx.ai initialization error: {str(e)}")
         return None
 
 def init_simplification_model():
     try:
-        model = Model(
-            model_id=os.getenv('MODEL_ID', 'ibm/granite-3-8b-instruct'),
-            credentials={
-                'apikey': os.getenv('WATSONX_API_KEY'), 
-                'url': os.getenv('WATSONX_URL')
-            },
-            project_id=os.getenv('WATSONX_PROJECT_ID'),
-            params={
-                "max_new_tokens": 400,
-                "temperature": 0.5,
-                "decoding_method": "greedy"
-            }
-        )
-        return model
+        return _watsonx_model({
+            "max_new_tokens": 400,
+            "temperature": 0.5,
+            "decoding_method": "greedy"
+        })
     except Exception as e:
         return None
 
-# Initialize models at startup
-watson_assistant = init_watson_assistant()
-llm_model = init_llm()
-simplification_model = init_simplification_model()
-
-def load_or_create_vectorstore():
-    if Path("faiss_index").exists() and Path("vector_data.json").exists():
-        index = faiss.read_index("faiss_index")
-        with open("vector_data.json", "r") as f:
-            data = json.load(f)
-        return index, data["chunks"], data["metadata"]
-    else:
-        return None, [], []
+async def _warm_up_component(name, init):
+    started = time.perf_counter()
+    startup_state["components"][name] = {"status": "loading"}
+    try:
+        result = await asyncio.to_thread(init)
+        status = "ready" if result is not None else "unavailable"
+        error = None
+    except Exception as e:
+        print(f"⚠ Warm-up of {name} failed: {e}")
+        result, status, error = None, "failed", str(e)[:200]
+    
+    startup_state["components"][name] = {
+        "status": status,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    if error:
+        startup_state["components"][name]["error"] = error
+    return result
+
+async def warm_up():
+    """Initialise clients and models concurrently after the server has started"""
+    global watson_assistant, watson_pool, llm_model, simplification_model
+    
+    # Bundles are installed first, so the default collection below is the bundle's
+    if os.getenv('INDEX_BUNDLES'):
+        await _warm_up_component("index_bundles", install_index_bundles)
+    
+    watson_assistant, llm_model, simplification_model, embedder, _ = await asyncio.gather(
+        _warm_up_component("watson_assistant", init_watson_assistant),
+        _warm_up_component("llm_model", init_llm),
+        _warm_up_component("simplification_model", init_simplification_model),
+        _warm_up_component("embedder", load_embeddings),
+        _warm_up_component("default_collection", lambda: get_collection().load()[0])
+    )
+    if embedder is not None and INTENT_ROUTER_ENABLED:
+        await _warm_up_component("intent_router", get_intent_router)
+    
+    # Keep Watson sessions pre-created so /session/create does not wait on Watson
+    if watson_assistant is not None and WATSON_POOL_SIZE > 0:
+        watson_pool = WatsonSessionPool(
+            lambda: open_watson_session(WATSON_POOL_USER_ID),
+            end_watson_session,
+            WATSON_POOL_SIZE,
+            WATSON_SESSION_MAX_AGE
+        )
+        watson_pool.start()
+    
+    # The embedder is the only hard requirement for answering questions;
+    # the IBM services are optional and reported through /status.
+    startup_state["ready"] = embedder is not None
+    startup_state["ready_at"] = datetime.now().isoformat()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up())
+    if SESSION_JOURNAL_ENABLED:
+        active_sessions.update(await asyncio.to_thread(session_journal.open))
+    yield
+    warm_up_task.cancel()
+    if watson_pool is not None:
+        await watson_pool.close()
+    await asyncio.to_thread(session_journal.close)
+    shutdown_embedding_pool()
+
+app = FastAPI(
+    title="Legal RAG Navigator API - Watson Flow with Processing Detection",
+    lifespan=lifespan
+)
+
+# Brotli when brotli-asgi is installed (it falls back to gzip for clients
+# without br support), plain gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1000'))
+if BROTLI_AVAILABLE:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+
+class UncompressedPathsMiddleware:
+    """Hides Accept-Encoding from the compression middleware for endpoints that
+    stream their response; it would otherwise buffer the whole stream"""
+    
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            scope = dict(scope)
+            scope["headers"] = [(name, value) for name, value in scope["headers"] if name != b"accept-encoding"]
+        await self.app(scope, receive, send)
+
+app.add_middleware(UncompressedPathsMiddleware, paths=["/chat/batch"])
+
+# Outermost, so traced requests also time serialisation and compression
+app.add_middleware(TraceMiddleware)
+
+SOURCE_SNIPPET_CHARS = int(os.getenv('SOURCE_SNIPPET_CHARS', '240'))
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def index_versions():
+    return tuple((name, get_collection(name).version()) for name in list_collections())
+
+def collections_for(names: List[str], create: bool = False) -> List[Collection]:
+    """Look up the named collections, 404 for unknown ones unless they are to be created"""
+    collections = []
+    for name in dict.fromkeys(names):
+        try:
+            collection = get_collection(name) if create else find_collection(name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if collection is None:
+            raise HTTPException(status_code=404, detail=f"Collection '{name}' not found")
+        collections.append(collection)
+    return collections
+
+def embed_queries(questions: List[str]) -> np.ndarray:
+    """Embed questions in one encode call, one float32 row per question"""
+    embedder = load_embeddings()
+    with stage("embed"):
+        q_embeddings = np.asarray(embedder.encode(questions, convert_to_numpy=True), dtype='float32')
+    return q_embeddings.reshape(len(questions), -1)
+
+def retrieve(
+    question: str,
+    collections: List[Collection],
+    k: int = 3,
+    rescore: Optional[bool] = None,
+    q_embedding: Optional[np.ndarray] = None,
+    filters: Optional[SearchFilters] = None,
+    diversity: Optional[Diversity] = None
+):
+    """Embed a question (unless its embedding is given) and search the given collections.
+    
+    Up to k diverse chunks are returned (default: the RETRIEVAL_* settings
+    in diversify.py). This is the retrieval path used by /chat; offline
+    tools call it too so that they measure exactly what users get.
+    """
+    if q_embedding is None:
+        q_embedding = embed_queries([question])
+    with stage("search"):
+        return search_collections(collections, q_embedding, k, rescore, filters, diversity or DEFAULT_DIVERSITY)[0]
+
+def retrieve_batch(questions: List[str], collections: List[Collection], k: int = 3, rescore: Optional[bool] = None):
+    """Embed all questions in one encode call and search them as one multi-query search"""
+    q_embeddings = embed_queries(questions)
+    with stage("search"):
+        return search_collections(collections, q_embeddings, k, rescore, diversity=DEFAULT_DIVERSITY)
+
+def format_sources(chunks):
+    """Turn retrieved or resolved chunks into the API's source entries"""
+    sources = []
+    for chunk in chunks:
+        meta = chunk["metadata"]
+        doc_name = Path(meta['source']).name if 'source' in meta else 'Unknown'
+        sources.append({
+            "source_number": len(sources) + 1,
+            "chunk_id": chunk["chunk_id"],
+            "collection": chunk["collection"],
+            "document": doc_name,
+            "page": meta.get('page', 'N/A'),
+            "content": chunk["content"]
+        })
+    return sources
+
+def build_sources(chunk_ids):
+    """Resolve chunk IDs against the chunk stores into the API's source entries"""
+    return format_sources(resolve_chunks(chunk_ids))
+
+def slim_sources(sources, source_format: str):
+    """Trim source entries to a snippet or to their IDs for smaller payloads"""
+    if source_format == "full":
+        return sources
+    slimmed = []
+    for source in sources:
+        source = dict(source)
+        content = source.pop("content")
+        if source_format == "snippet":
+            source["snippet"] = content if len(content) <= SOURCE_SNIPPET_CHARS else content[:SOURCE_SNIPPET_CHARS].rstrip() + "…"
+        slimmed.append(source)
+    return slimmed
+
+ANSWER_PROMPT_TEMPLATE = """You are explaining legal matters to someone who has never studied law and doesn't understand legal language.
+
+Previous Conversation (for context):
+{history}
+
+Context from legal documents: {context}
+
+User's Question: {question}
+
+INSTRUCTIONS:
+- Use only simple everyday words (like talking to a family member)
+- Explain what each legal term means in normal language
+- Tell them exactly what they need to do step by step
+- Use "you" and "your" 
+- Break into very short sentences
+- Imagine explaining to someone who finished 8th grade
+
+SIMPLIFIED EXPLANATION:"""
+
+def build_answer_prompt(history: str, context: str, question: str) -> str:
+    return ANSWER_PROMPT_TEMPLATE.format(
+        history=history if history else "No previous conversation",
+        context=context,
+        question=question
+    )
+
+def generate_answer(prompt: str) -> Optional[str]:
+    """Generate the simplified answer, or None when no watsonx.ai model is available"""
+    # Use simplification model if available, otherwise use main LLM
+    simplifier = simplification_model if simplification_model else llm_model
+    if simplifier is None:
+        return None
+    return simplifier.generate_text(prompt)
+
+def stream_answer(prompt: str) -> Optional[Iterator[str]]:
+    """Generate the simplified answer as a stream of text pieces, or None when no watsonx.ai model is available"""
+    simplifier = simplification_model if simplification_model else llm_model
+    if simplifier is None:
+        return None
+    return simplifier.generate_text_stream(prompt)
 
 # Pydantic models
+# Used when a client does not identify its user; the web frontend never does
+DEFAULT_USER_ID = "sit23cs199@sairamtap.edu.in"
+
 class SessionCreateRequest(BaseModel):
-    user_id: Optional[str] = "sit23cs199@sairamtap.edu.in"
+    user_id: Optional[str] = DEFAULT_USER_ID
 
 class SessionCreateResponse(BaseModel):
     session_id: str
     watson_session_id: Optional[str] = None
     welcome_message: str
 
+class ChatFilters(BaseModel):
+    # Documents whose file name contains every word of one of these terms,
+    # e.g. "2023 amendment" matches land_reforms_2023_amendment.pdf
+    documents: Optional[List[str]] = None
+    # Inclusive page range, numbered like the "page" of returned sources
+    page_from: Optional[int] = Field(None, ge=0)
+    page_to: Optional[int] = Field(None, ge=0)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    
+    def to_search_filters(self) -> Optional[SearchFilters]:
+        filters = SearchFilters(**{**self.dict(), "documents": tuple(self.documents) if self.documents is not None else None})
+        return filters if filters.active() else None
+
 class ChatRequest(BaseModel):
     session_id: str
     question: str
-    user_id: Optional[str] = "sit23cs199@sairamtap.edu.in"
+    user_id: Optional[str] = DEFAULT_USER_ID
+    collection: str = DEFAULT_COLLECTION
+    # Search several collections at once; overrides `collection`
+    collections: Optional[List[str]] = None
+    # "full" chunk text, a short "snippet", or "id" only (fetch with GET /chunks/{id})
+    source_format: Literal["full", "snippet", "id"] = "full"
+    include_context: bool = True
+    # Seconds the client is prepared to wait for a generated answer
+    deadline_seconds: Optional[float] = Field(None, gt=0)
+    # Return sources without an answer instead of 503 when generation is at capacity
+    allow_degraded: bool = True
+    # Only search chunks matching these document, page and upload-date filters
+    filters: Optional[ChatFilters] = None
+    # Most chunks to retrieve; fewer are returned when the rest are much
+    # further away than the best hit (max_distance_ratio, 0 disables)
+    k: int = Field(3, ge=1, le=20)
+    max_distance_ratio: Optional[float] = Field(None, ge=0)
+    # Relevance/diversity trade-off of the chunks picked, 1 for relevance only
+    mmr_lambda: Optional[float] = Field(None, ge=0, le=1)
+    
+    def to_diversity(self) -> Diversity:
+        return Diversity(
+            mmr_lambda=MMR_LAMBDA if self.mmr_lambda is None else self.mmr_lambda,
+            max_distance_ratio=MAX_DISTANCE_RATIO if self.max_distance_ratio is None else self.max_distance_ratio,
+            candidates=max(MMR_CANDIDATES, self.k)
+        )
+
+class BatchChatRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=2000)
+    collection: str = DEFAULT_COLLECTION
+    collections: Optional[List[str]] = None
+    k: int = Field(3, ge=1, le=20)
+    # Retrieval only when False
+    generate: bool = True
+    max_concurrency: int = Field(4, ge=1)
 
 class WatsonStage(BaseModel):
     response: str
-    follow_ups: List[str]
-    intents: List[Dict[str, Any]]
-    entities: List[Dict[str, Any]]
-    actions: List[Dict[str, Any]]
-    is_goodbye: bool
-    has_actions: bool
-    should_generate_answer: bool
+    follow_ups: List[str] = []
+    intents: List[Dict[str, Any]] = []
+    entities: List[Dict[str, Any]] = []
+    actions: List[Dict[str, Any]] = []
+    is_goodbye: bool = False
+    has_actions: bool = False
+    should_generate_answer: bool = False
+    # True when the local intent router answered or routed the turn without Watson
+    handled_locally: bool = False
+
+def compact_watson_stage(stage: Optional[WatsonStage]):
+    """History form of a WatsonStage: the response text is already the message
+    content, and empty or false fields fall back to the model defaults"""
+    if stage is None:
+        return None
+    return {key: value for key, value in stage.dict(exclude={"response"}).items() if value}
+
+def expand_watson_stage(compact: Optional[Dict[str, Any]], response: str):
+    if compact is None:
+        return None
+    return WatsonStage(response=response, **compact).dict()
 
 class ChatResponse(BaseModel):
     watson_stage: Optional[WatsonStage] = None
@@ -144,7 +540,13 @@ class ChatResponse(BaseModel):
     sources: List[Dict[str, Any]]
     timestamp: str
     awaiting_followup: bool
-    conversation_context: List[str]
+    conversation_context: Optional[List[str]] = None
+    # True when generation capacity was exhausted and only sources are returned
+    degraded: bool = False
+    # True when the answer was served from the precomputed table
+    precomputed: bool = False
+    # Stage timings in milliseconds, only for requests traced with X-Debug-Trace
+    timings: Optional[Dict[str, float]] = None
 
 class SessionStatus(BaseModel):
     session_id: str
@@ -154,6 +556,283 @@ class SessionStatus(BaseModel):
     message_count: int
     chat_session_started: bool
 
+DEFAULT_WELCOME_MESSAGE = "Welcome to Legal RAG Navigator! 👋 Ask me any question about land tenure laws."
+
+def open_watson_session(user_id=None):
+    """Create a Watson session and fetch its welcome message, returning (session ID, welcome message)"""
+    session_response = watson_assistant['assistant'].create_session(
+        assistant_id=watson_assistant['assistant_id'],
+        environment_id=watson_assistant['environment_id']
+    ).get_result()
+    watson_session_id = session_response['session_id']
+    
+    # Get welcome message
+    response = watson_assistant['assistant'].message(
+        assistant_id=watson_assistant['assistant_id'],
+        environment_id=watson_assistant['environment_id'],
+        session_id=watson_session_id,
+        input={'message_type': 'text', 'text': ''},
+        user_id=user_id
+    ).get_result()
+    
+    welcome_message = DEFAULT_WELCOME_MESSAGE
+    if response['output']['generic']:
+        welcome_message = response['output']['generic'][0].get('text', welcome_message)
+    return watson_session_id, welcome_message
+
+def end_watson_session(watson_session_id):
+    watson_assistant['assistant'].delete_session(
+        assistant_id=watson_assistant['assistant_id'],
+        environment_id=watson_assistant['environment_id'],
+        session_id=watson_session_id
+    )
+
+def end_watson_session_quietly(watson_session_id):
+    """end_watson_session for fire-and-forget use: failures are logged, not raised"""
+    try:
+        end_watson_session(watson_session_id)
+    except Exception as e:
+        print(f"⚠ Could not delete Watson session {watson_session_id}: {e}")
+
+RAG_HANDOFF_MESSAGE = "Let me check the legal documents for you..."
+
+def local_turn(session_data, route) -> WatsonStage:
+    """Answer a greeting, thanks or goodbye without calling Watson"""
+    is_goodbye = route.intent == "goodbye"
+    session_data["awaiting_followup"] = False
+    if is_goodbye:
+        session_data["conversation_context"] = []
+        watson_session_id = session_data.get("watson_session_id")
+        if watson_assistant and watson_session_id:
+            session_data["watson_session_id"] = None
+            asyncio.get_running_loop().run_in_executor(None, end_watson_session_quietly, watson_session_id)
+    
+    return WatsonStage(
+        response=LOCAL_REPLIES[route.intent],
+        intents=[{"intent": route.intent, "confidence": route.confidence}],
+        is_goodbye=is_goodbye,
+        handled_locally=True
+    )
+
+def cap_context(context: List[str]) -> List[str]:
+    """Bound follow-up context to CONTEXT_MAX_TURNS turns and CONTEXT_MAX_CHARS characters,
+    keeping the question that opened the topic and then the most recent turns"""
+    if not context:
+        return []
+    first = context[0][:CONTEXT_MAX_CHARS]
+    kept, chars = [], len(first)
+    for turn in reversed(context[1:][-(CONTEXT_MAX_TURNS - 1):] if CONTEXT_MAX_TURNS > 1 else []):
+        if chars + len(turn) > CONTEXT_MAX_CHARS:
+            break
+        kept.append(turn)
+        chars += len(turn)
+    return [first] + kept[::-1]
+
+def update_query_vector(session_data, q_embedding: np.ndarray, follow_up: bool) -> np.ndarray:
+    """Fold a turn's embedding into the session's decayed weighted average and return it.
+    
+    A follow-up is retrieved with the average, so "what about for my son?"
+    still finds the documents of the question it follows; any other turn
+    starts a new average.
+    """
+    if follow_up and session_data.get("query_vector") is not None:
+        total, weight = session_data["query_vector"]
+        total = QUERY_VECTOR_DECAY * total + q_embedding
+        weight = QUERY_VECTOR_DECAY * weight + 1.0
+    else:
+        total, weight = q_embedding.copy(), 1.0
+    session_data["query_vector"] = (total, weight)
+    return (total / weight).astype('float32').reshape(1, -1)
+
+def send_watson_message(session_data, text, user_id):
+    """Send a message in the session's Watson session.
+    
+    Watson ends sessions after 5 minutes of inactivity, so the session of a
+    chat recovered from the journal (or one idle for long) may be gone; a new
+    one is then opened and the message sent again.
+    """
+    def send():
+        return watson_assistant['assistant'].message(
+            assistant_id=watson_assistant['assistant_id'],
+            environment_id=watson_assistant['environment_id'],
+            session_id=session_data["watson_session_id"],
+            input={'message_type': 'text', 'text': text},
+            user_id=user_id
+        ).get_result()
+    
+    try:
+        return send()
+    except Exception as e:
+        # ibm_watson raises ApiException with code 404 for an unknown or expired session
+        if getattr(e, "code", None) != 404:
+            raise
+    session_data["watson_session_id"], _ = open_watson_session(user_id)
+    return send()
+
+def watson_turn(session_data, question, user_id) -> Optional[WatsonStage]:
+    """Send a turn to Watson Assistant and update the session's follow-up state.
+    
+    Returns None if Watson fails; the session then continues without it.
+    """
+    follow_up_questions = []
+    watson_intents = []
+    watson_entities = []
+    watson_actions = []
+    has_actions = False
+    is_goodbye = False
+    
+    try:
+        # Build combined query for follow-ups
+        if session_data["awaiting_followup"] and session_data["conversation_context"]:
+            combined_query = " ".join(cap_context(session_data["conversation_context"])) + " " + question
+            clean_question = combined_query.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+        else:
+            clean_question = question.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+            session_data["conversation_context"] = [question]
+        
+        response = send_watson_message(session_data, clean_question, user_id)
+        watson_session_id = session_data["watson_session_id"]
+        
+        # Extract Watson responses
+        watson_messages = []
+        if response['output']['generic']:
+            for item in response['output']['generic']:
+                if item.get('response_type') == 'text':
+                    text = item.get('text', '')
+                    if text:
+                        watson_messages.append(text)
+        
+        watson_response = "\n\n".join(watson_messages) if watson_messages else "No response"
+        follow_up_questions = [msg for msg in watson_messages if '?' in msg]
+        
+        # Check if Watson is processing/checking (keywords that indicate Watson needs our help)
+        processing_keywords = ['checking', 'typing', 'pause', 'documentation', 'searching', 'looking', 'reviewing', 'analyzing']
+        should_generate_answer = any(keyword in watson_response.lower() for keyword in processing_keywords)
+        
+        # Check for goodbye
+        if watson_response and "goodbye" in watson_response.lower():
+            is_goodbye = True
+            session_data["awaiting_followup"] = False
+            session_data["conversation_context"] = []
+            
+            # End Watson session
+            try:
+                end_watson_session(watson_session_id)
+                session_data["watson_session_id"] = None
+            except:
+                pass
+        
+        # Check for actions
+        if 'actions' in response['output'] and response['output']['actions'] and not is_goodbye:
+            watson_actions = response['output']['actions']
+            
+            for action in watson_actions:
+                if action.get('name') == 'session_end' or action.get('type') == 'end_session':
+                    is_goodbye = True
+                    session_data["awaiting_followup"] = False
+                    session_data["conversation_context"] = []
+                    
+                    try:
+                        end_watson_session(watson_session_id)
+                        session_data["watson_session_id"] = None
+                    except:
+                        pass
+                    break
+            
+            if not is_goodbye:
+                has_actions = True
+                if follow_up_questions:
+                    session_data["awaiting_followup"] = True
+                    if question not in session_data["conversation_context"]:
+                        session_data["conversation_context"] = cap_context(session_data["conversation_context"] + [question])
+                else:
+                    session_data["awaiting_followup"] = False
+        else:
+            has_actions = False
+            session_data["awaiting_followup"] = False
+        
+        if 'intents' in response['output']:
+            watson_intents = response['output']['intents']
+        if 'entities' in response['output']:
+            watson_entities = response['output']['entities']
+        
+        return WatsonStage(
+            response=watson_response,
+            follow_ups=follow_up_questions,
+            intents=watson_intents,
+            entities=watson_entities,
+            actions=watson_actions,
+            is_goodbye=is_goodbye,
+            has_actions=has_actions,
+            should_generate_answer=should_generate_answer
+        )
+    
+    except Exception as e:
+        print(f"Watson error: {e}")
+        session_data["watson_session_id"] = None
+        session_data["awaiting_followup"] = False
+        return None
+
+# Identical concurrent questions share their embedding and retrieval, and
+# identical prompts (same question, sources and history) share one generation
+embedding_flights = SingleFlight("embedding")
+retrieval_flights = SingleFlight("retrieval")
+generation_flights = SingleFlight("generation")
+
+async def coalesced_embedding(question: str) -> np.ndarray:
+    """Return the question's embedding, joining an identical embedding already in flight"""
+    return await embedding_flights.do(normalize_question(question), lambda: asyncio.to_thread(embed_queries, [question]))
+
+async def coalesced_retrieval(
+    question: str,
+    collections: List[Collection],
+    q_embedding: np.ndarray,
+    k: int = 3,
+    filters: Optional[SearchFilters] = None,
+    diversity: Optional[Diversity] = None
+):
+    """Return the hits for an embedded question, joining an identical retrieval already in flight"""
+    key = (normalize_question(question), tuple(collection.name for collection in collections), k, filters, diversity)
+    return await retrieval_flights.do(key, lambda: asyncio.to_thread(
+        retrieve, question, collections, k, None, q_embedding, filters, diversity
+    ))
+
+async def coalesced_generation(prompt: str, admission_key: str, deadline: Optional[float]):
+    """Generate an answer under admission control, joining an identical generation already in flight"""
+    async def admitted_generation():
+        async with generation_admission.slot(admission_key, deadline):
+            with stage("generate"):
+                return await asyncio.to_thread(generate_answer, prompt)
+    
+    key = hashlib.sha256(prompt.encode()).hexdigest()
+    return await generation_flights.do(key, admitted_generation)
+
+async def streamed_generation(
+    prompt: str,
+    admission_key: str,
+    deadline: Optional[float],
+    emit: Callable[[Dict[str, Any]], Awaitable[None]]
+) -> Optional[str]:
+    """Generate an answer under admission control, emitting each piece of text as it arrives.
+    
+    The next piece is only read from watsonx.ai once emit has accepted the
+    previous one, so a slow client slows generation down instead of
+    buffering the answer.
+    """
+    async with generation_admission.slot(admission_key, deadline):
+        with stage("generate"):
+            pieces = stream_answer(prompt)
+            if pieces is None:
+                return None
+            answer = []
+            while True:
+                piece = await asyncio.to_thread(next, pieces, None)
+                if piece is None:
+                    break
+                answer.append(piece)
+                await emit({"type": "token", "text": piece})
+            return "".join(answer)
+
 # API Endpoints
 
 @app.get("/")
@@ -164,24 +843,71 @@ async def root():
         "version": "Final",
         "description": "Watson flow with processing detection",
         "endpoints": {
+            "GET /health/live": "Liveness probe",
+            "GET /health/ready": "Readiness probe (models warmed up)",
             "POST /session/create": "Create new chat session",
             "POST /chat": "Send message with Watson flow tracking",
+            "POST /chat/batch": "Answer many questions at once, streamed as NDJSON",
+            "WS /ws/chat/{session_id}": "Chat over a persistent connection with streamed answers",
             "GET /session/{session_id}/status": "Get session status",
-            "GET /chat/history/{session_id}": "Get chat history",
+            "GET /chat/history/{session_id}": "Get chat history (paginated)",
+            "GET /chunks/{chunk_id}": "Fetch a source chunk by ID",
             "DELETE /session/{session_id}": "Delete session",
-            "POST /upload": "Upload and index PDFs",
+            "POST /upload": "Upload and index PDFs into a collection",
+            "GET /collections": "List collections and their stats",
+            "GET /collections/{name}/documents": "List a collection's documents, pages and upload dates",
             "GET /status": "System status",
-            "DELETE /clear": "Clear document index"
+            "DELETE /clear": "Clear a collection's document index",
+            "GET /admin/collections/{name}/versions": "List a collection's retained index versions",
+            "POST /admin/collections/{name}/rollback": "Publish a retained index version",
+            "GET /admin/profile": "Capture a sampling, cProfile or tracemalloc profile of this worker"
         },
         "docs": "/docs"
     })
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness probe - the process is up and serving requests"""
+    return JSONResponse({"status": "live"})
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness probe - warm-up has finished and questions can be answered"""
+    ready = startup_state["ready"]
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "starting",
+            "started_at": startup_state["started_at"],
+            "ready_at": startup_state.get("ready_at"),
+            "components": startup_state["components"]
+        },
+        status_code=200 if ready else 503
+    )
+
 @app.post("/upload")
-async def upload_documents(files: List[UploadFile] = File(...)):
-    """Upload and index PDF documents"""
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    collection: str = Form(DEFAULT_COLLECTION),
+    append: bool = Form(False),
+    encoding: Optional[str] = Form(None, description="Index encoding: flat, fp16, sq8 or pq"),
+    extractor: Optional[str] = Form(None, description="PDF text extractor; defaults to the fastest installed"),
+    chunker: Optional[str] = Form(None, description="Chunker: recursive or legal (section-aware)")
+):
+    """Upload and index PDF documents into a collection"""
+    target = collections_for([collection], create=True)[0]
+    if encoding is not None and encoding not in INDEX_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown index encoding '{encoding}'. Use one of: {', '.join(INDEX_ENCODINGS)}")
+    if chunker is not None and chunker not in CHUNKERS:
+        raise HTTPException(status_code=400, detail=f"Unknown chunker '{chunker}'. Use one of: {', '.join(CHUNKERS)}")
+    try:
+        select_extractor(extractor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         temp_dir = tempfile.mkdtemp()
         uploaded_file_names = []
+        uploaded_paths = []
         
         for file in files:
             if not file.filename.endswith('.pdf'):
@@ -192,41 +918,50 @@ async def upload_documents(files: List[UploadFile] = File(...)):
                 content = await file.read()
                 f.write(content)
             uploaded_file_names.append(file.filename)
+            uploaded_paths.append(Path(file_path))
         
-        loader = PyPDFDirectoryLoader(temp_dir)
-        documents = loader.load()
-        
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(documents)
-        
-        embedder = load_embeddings()
-        def embed_text(texts):
-            return embedder.encode(texts, convert_to_numpy=True)
-        
-        embeddings = embed_text([chunk.page_content for chunk in chunks])
-        dimension = len(embeddings[0])
-        index = faiss.IndexFlatL2(dimension)
-        index.add(np.array(embeddings).astype('float32'))
-        
-        vector_store_data = {
-            "chunks": [chunk.page_content for chunk in chunks],
-            "metadata": [chunk.metadata for chunk in chunks],
-            "embeddings": embeddings.tolist()
-        }
+        def build_version():
+            documents = load_documents(uploaded_paths, extractor)
+            chunks = split_documents(documents, chunker)
+            
+            # Large uploads are embedded across worker processes
+            embeddings, embedding_stats = embed_documents(
+                [chunk.page_content for chunk in chunks], EMBEDDING_MODEL, load_embeddings()
+            )
+            chunk_texts = [chunk.page_content for chunk in chunks]
+            chunk_metadata = [chunk.metadata for chunk in chunks]
+            
+            if append:
+                try:
+                    version = target.append(chunk_texts, chunk_metadata, embeddings, EMBEDDING_MODEL, encoding)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            else:
+                version = target.write(chunk_texts, chunk_metadata, embeddings, EMBEDDING_MODEL, encoding)
+            return len(chunks), version, embedding_stats
         
-        faiss.write_index(index, "faiss_index")
-        with open("vector_data.json", "w") as f:
-            json.dump(vector_store_data, f)
+        # The new version is built off the event loop and published atomically,
+        # so chats keep being answered from the previous version meanwhile
+        new_chunks, version, embedding_stats = await asyncio.to_thread(build_version)
         
         shutil.rmtree(temp_dir)
         
+        stats = target.stats(version)
         return JSONResponse({
             "status": "success",
-            "message": f"Documents indexed successfully! {len(chunks)} chunks from {len(files)} document(s)",
+            "message": f"Documents indexed successfully! {new_chunks} chunks from {len(files)} document(s)",
+            "collection": target.name,
+            "version": version,
             "indexed_files": uploaded_file_names,
-            "total_chunks": len(chunks)
+            "total_chunks": stats["total_chunks"],
+            "encoding": stats["encoding"],
+            "bytes_per_vector": stats["bytes_per_vector"],
+            "recall_at_10": stats.get("recall_at_10", 1.0),
+            "embedding": embedding_stats
         })
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error indexing documents: {str(e)}")
 
@@ -236,27 +971,16 @@ async def create_session(request: SessionCreateRequest):
     session_id = str(uuid.uuid4())
     
     watson_session_id = None
-    welcome_message = "Welcome to Legal RAG Navigator! 👋 Ask me any question about land tenure laws."
+    welcome_message = DEFAULT_WELCOME_MESSAGE
     
-    if watson_assistant:
+    # A pre-created session from the pool is handed out at once; when the
+    # pool is empty (or disabled) one is created for this request
+    pooled = watson_pool.acquire() if watson_pool is not None else None
+    if pooled is not None:
+        watson_session_id, welcome_message = pooled.watson_session_id, pooled.welcome_message
+    elif watson_assistant:
         try:
-            session_response = watson_assistant['assistant'].create_session(
-                assistant_id=watson_assistant['assistant_id'],
-                environment_id=watson_assistant['environment_id']
-            ).get_result()
-            watson_session_id = session_response['session_id']
-            
-            # Get welcome message
-            response = watson_assistant['assistant'].message(
-                assistant_id=watson_assistant['assistant_id'],
-                environment_id=watson_assistant['environment_id'],
-                session_id=watson_session_id,
-                input={'message_type': 'text', 'text': ''},
-                user_id=request.user_id
-            ).get_result()
-            
-            if response['output']['generic']:
-                welcome_message = response['output']['generic'][0].get('text', welcome_message)
+            watson_session_id, welcome_message = await asyncio.to_thread(open_watson_session, request.user_id)
         except Exception as e:
             print(f"Watson session creation error: {e}")
     
@@ -271,9 +995,11 @@ async def create_session(request: SessionCreateRequest):
         "user_id": request.user_id,
         "created_at": datetime.now().isoformat(),
         "conversation_context": [],
+        "query_vector": None,
         "awaiting_followup": False,
         "chat_session_started": True
     }
+    session_journal.created(session_id, active_sessions[session_id])
     
     return SessionCreateResponse(
         session_id=session_id,
@@ -288,15 +1014,30 @@ async def chat(request: ChatRequest):
     if request.session_id not in active_sessions:
         raise HTTPException(status_code=404, detail="Session not found. Create a session first.")
     
-    session_data = active_sessions[request.session_id]
-    watson_session_id = session_data.get("watson_session_id")
+    response = await answer_turn(request, active_sessions[request.session_id])
+    mark_handler_done()
+    return response
+
+async def answer_turn(request: ChatRequest, session_data, emit: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> ChatResponse:
+    """Answer one chat turn of a session.
     
-    # Load vector store
-    index, chunks, metadata = load_or_create_vectorstore()
+    With emit, the Watson stage, the sources and each generated token are
+    also sent through it as soon as they are ready (see /ws/chat).
+    """
+    watson_session_id = session_data.get("watson_session_id")
     
-    if not index:
+    search_targets = collections_for(request.collections or [request.collection])
+    if not any(collection.exists() for collection in search_targets):
         raise HTTPException(status_code=400, detail="No documents indexed. Please upload documents first.")
     
+    # Generation queues are per user; requests without a real user ID are
+    # queued per session so that browser users do not share one queue.
+    # Admission is only checked once the turn turns out to need generation.
+    admission_key = request.session_id if request.user_id in (None, DEFAULT_USER_ID) else request.user_id
+    deadline = time.monotonic() + (request.deadline_seconds or GENERATION_DEFAULT_DEADLINE_SECONDS)
+    
+    # Whatever the turn adds to the session is journaled, even if it fails part way
+    first_new_message = len(session_data["messages"])
     try:
         # Add user message to history
         session_data["messages"].append({
@@ -305,209 +1046,275 @@ async def chat(request: ChatRequest):
             "timestamp": datetime.now().isoformat()
         })
         
-        # Embed question and search
-        embedder = load_embeddings()
-        q_embedding = embedder.encode(request.question).reshape(1, -1)
-        distances, indices = index.search(q_embedding, k=3)
-        retrieved_chunks = [chunks[i] for i in indices[0]]
-        retrieved_meta = [metadata[i] for i in indices[0]]
-        context = "\n\n".join(retrieved_chunks)
+        # Embed the question once for intent routing, the session's query
+        # vector and retrieval; concurrent identical questions share one
+        # embedding. Follow-ups are searched with the query vector instead.
+        filters = request.filters.to_search_filters() if request.filters else None
+        diversity = request.to_diversity()
+        follow_up = session_data["awaiting_followup"] and bool(session_data["conversation_context"])
+        q_embedding = await coalesced_embedding(request.question)
+        search_vector = update_query_vector(session_data, q_embedding[0], follow_up=follow_up)
+        route = None
+        if INTENT_ROUTER_ENABLED and not session_data["awaiting_followup"]:
+            route = get_intent_router().route(q_embedding[0])
         
-        # Watson Assistant Flow with Processing Detection
+        # Watson Assistant Flow with Processing Detection, unless the local
+        # router is confident enough to handle the turn itself
         watson_stage_data = None
-        watson_response = None
-        follow_up_questions = []
-        watson_intents = []
-        watson_entities = []
-        watson_actions = []
-        has_actions = False
-        is_goodbye = False
-        should_generate_answer = False
+        if route is not None and route.action == "local":
+            watson_stage_data = local_turn(session_data, route)
+        elif route is not None and route.action == "rag":
+            session_data["conversation_context"] = [request.question]
+            watson_stage_data = WatsonStage(
+                response=RAG_HANDOFF_MESSAGE,
+                intents=[{"intent": route.intent, "confidence": route.confidence}],
+                should_generate_answer=True,
+                handled_locally=True
+            )
+        elif watson_assistant and watson_session_id:
+            with stage("watson"):
+                watson_stage_data = await asyncio.to_thread(watson_turn, session_data, request.question, request.user_id)
         
-        if watson_assistant and watson_session_id:
-            try:
-                # Build combined query for follow-ups
-                if session_data["awaiting_followup"] and session_data["conversation_context"]:
-                    combined_query = " ".join(session_data["conversation_context"]) + " " + request.question
-                    clean_question = combined_query.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
-                else:
-                    clean_question = request.question.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
-                    session_data["conversation_context"] = [request.question]
-                
-                response = watson_assistant['assistant'].message(
-                    assistant_id=watson_assistant['assistant_id'],
-                    environment_id=watson_assistant['environment_id'],
-                    session_id=watson_session_id,
-                    input={'message_type': 'text', 'text': clean_question},
-                    user_id=request.user_id
-                ).get_result()
-                
-                # Extract Watson responses
-                watson_messages = []
-                if response['output']['generic']:
-                    for item in response['output']['generic']:
-                        if item.get('response_type') == 'text':
-                            text = item.get('text', '')
-                            if text:
-                                watson_messages.append(text)
-                
-                watson_response = "\n\n".join(watson_messages) if watson_messages else "No response"
-                follow_up_questions = [msg for msg in watson_messages if '?' in msg]
-                
-                # Check if Watson is processing/checking (keywords that indicate Watson needs our help)
-                processing_keywords = ['checking', 'typing', 'pause', 'documentation', 'searching', 'looking', 'reviewing', 'analyzing']
-                should_generate_answer = any(keyword in watson_response.lower() for keyword in processing_keywords)
-                
-                # Check for goodbye
-                if watson_response and "goodbye" in watson_response.lower():
-                    is_goodbye = True
-                    session_data["awaiting_followup"] = False
-                    session_data["conversation_context"] = []
-                    
-                    # End Watson session
-                    try:
-                        watson_assistant['assistant'].delete_session(
-                            assistant_id=watson_assistant['assistant_id'],
-                            environment_id=watson_assistant['environment_id'],
-                            session_id=watson_session_id
-                        )
-                        session_data["watson_session_id"] = None
-                    except:
-                        pass
-                
-                # Check for actions
-                if 'actions' in response['output'] and response['output']['actions'] and not is_goodbye:
-                    watson_actions = response['output']['actions']
-                    
-                    for action in watson_actions:
-                        if action.get('name') == 'session_end' or action.get('type') == 'end_session':
-                            is_goodbye = True
-                            session_data["awaiting_followup"] = False
-                            session_data["conversation_context"] = []
-                            
-                            try:
-                                watson_assistant['assistant'].delete_session(
-                                    assistant_id=watson_assistant['assistant_id'],
-                                    environment_id=watson_assistant['environment_id'],
-                                    session_id=watson_session_id
-                                )
-                                session_data["watson_session_id"] = None
-                            except:
-                                pass
-                            break
-                    
-                    if not is_goodbye:
-                        has_actions = True
-                        if follow_up_questions:
-                            session_data["awaiting_followup"] = True
-                            if request.question not in session_data["conversation_context"]:
-                                session_data["conversation_context"].append(request.question)
-                        else:
-                            session_data["awaiting_followup"] = False
-                else:
-                    has_actions = False
-                    session_data["awaiting_followup"] = False
-                
-                if 'intents' in response['output']:
-                    watson_intents = response['output']['intents']
-                if 'entities' in response['output']:
-                    watson_entities = response['output']['entities']
-                
-                watson_stage_data = WatsonStage(
-                    response=watson_response,
-                    follow_ups=follow_up_questions,
-                    intents=watson_intents,
-                    entities=watson_entities,
-                    actions=watson_actions,
-                    is_goodbye=is_goodbye,
-                    has_actions=has_actions,
-                    should_generate_answer=should_generate_answer
-                )
-                
-            except Exception as e:
-                print(f"Watson error: {e}")
-                session_data["watson_session_id"] = None
-                session_data["awaiting_followup"] = False
+        watson_response = watson_stage_data.response if watson_stage_data else None
+        should_generate_answer = watson_stage_data.should_generate_answer if watson_stage_data else False
+        is_goodbye = watson_stage_data.is_goodbye if watson_stage_data else False
+        if is_goodbye and watson_pool is not None:
+            # The frontend starts a new chat after a goodbye; have its session ready
+            watson_pool.replenish()
+        if emit is not None and watson_stage_data is not None:
+            await emit({
+                "type": "watson_stage",
+                "watson_stage": watson_stage_data.dict(),
+                "awaiting_followup": session_data["awaiting_followup"]
+            })
+        
+        # Frequent questions are answered from the precomputed table, built
+        # against the same index versions and retrieval settings, instead of
+        # being generated again
+        precomputed_answer = None
+        # Follow-ups are retrieved with the session's blended query vector, so
+        # they are neither logged nor answered from the table
+        default_retrieval = not follow_up and filters is None and request.k == 3 and diversity == DEFAULT_DIVERSITY
+        if should_generate_answer and not is_goodbye and default_retrieval:
+            await asyncio.to_thread(log_question, request.question, [collection.name for collection in search_targets])
+            if PRECOMPUTED_ANSWERS_ENABLED:
+                precomputed_answer = precomputed_answers.lookup(request.question, search_targets)
         
         # Only generate simplified answer if Watson is checking/processing (not goodbye, and has keywords)
         simplified_answer = None
-        if should_generate_answer and not is_goodbye and llm_model:
+        degraded = False
+        retrieved_ids, context = [], ""
+        if precomputed_answer is not None:
+            simplified_answer = precomputed_answer["answer"]
+            retrieved_ids = precomputed_answer["chunk_ids"]
+        elif should_generate_answer and not is_goodbye:
+            # Only turns that are answered from the documents are searched
+            if follow_up:
+                hits = await asyncio.to_thread(retrieve, request.question, search_targets, request.k, None, search_vector, filters, diversity)
+            else:
+                hits = await coalesced_retrieval(request.question, search_targets, q_embedding, k=request.k, filters=filters, diversity=diversity)
+            retrieved_ids = [hit["chunk_id"] for hit in hits]
+            context = "\n\n".join(hit["content"] for hit in hits)
+        
+        # Prepare sources (only if answer was generated)
+        source_ids = retrieved_ids if should_generate_answer and not is_goodbye else []
+        sources = slim_sources(await asyncio.to_thread(build_sources, source_ids), request.source_format)
+        if emit is not None:
+            if sources:
+                await emit({"type": "sources", "sources": sources})
+            if simplified_answer is not None:
+                await emit({"type": "token", "text": simplified_answer})
+        
+        if precomputed_answer is None and should_generate_answer and not is_goodbye and llm_model:
             try:
-                conversation_history = ""
-                for msg in session_data["messages"][-4:]:
-                    if msg["role"] == "user":
-                        conversation_history += f"User: {msg['content']}\n"
-                    elif msg["role"] == "assistant" and "stages" not in msg:
-                        conversation_history += f"Assistant: {msg['content']}\n"
-                
-                prompt_template = """You are explaining legal matters to someone who has never studied law and doesn't understand legal language.
-
-Previous Conversation (for context):
-{history}
-
-Context from legal documents: {context}
-
-User's Question: {question}
-
-INSTRUCTIONS:
-- Use only simple everyday words (like talking to a family member)
-- Explain what each legal term means in normal language
-- Tell them exactly what they need to do step by step
-- Use "you" and "your" 
-- Break into very short sentences
-- Imagine explaining to someone who finished 8th grade
-
-SIMPLIFIED EXPLANATION:"""
-                
-                full_prompt = prompt_template.format(
-                    history=conversation_history if conversation_history else "No previous conversation",
-                    context=context,
-                    question=request.question
-                )
-                
-                # Use simplification model if available, otherwise use main LLM
-                simplifier = simplification_model if simplification_model else llm_model
-                simplified_answer = simplifier.generate_text(full_prompt)
+                with stage("prompt"):
+                    conversation_history = ""
+                    for msg in session_data["messages"][-4:]:
+                        if msg["role"] == "user":
+                            conversation_history += f"User: {msg['content']}\n"
+                        elif msg["role"] == "assistant" and "stages" not in msg:
+                            conversation_history += f"Assistant: {msg['content']}\n"
+                    
+                    full_prompt = build_answer_prompt(conversation_history, context, request.question)
+                if emit is None:
+                    simplified_answer = await coalesced_generation(full_prompt, admission_key, deadline)
+                else:
+                    simplified_answer = await streamed_generation(full_prompt, admission_key, deadline, emit)
+            except AdmissionRejected as e:
+                if not request.allow_degraded:
+                    raise HTTPException(
+                        status_code=e.status_code,
+                        detail=e.reason,
+                        headers={"Retry-After": e.retry_after_header}
+                    )
+                # Out of generation capacity: answer with the retrieved sources only
+                degraded = True
             except Exception as e:
                 print(f"Answer generation error: {e}")
                 simplified_answer = None
         
-        # Prepare sources (only if answer was generated)
-        sources_list = []
-        if should_generate_answer and not is_goodbye:
-            for i, chunk in enumerate(retrieved_chunks):
-                doc_name = Path(retrieved_meta[i].get('source', 'Unknown')).name if 'source' in retrieved_meta[i] else 'Unknown'
-                sources_list.append({
-                    "source_number": i + 1,
-                    "document": doc_name,
-                    "page": retrieved_meta[i].get('page', 'N/A'),
-                    "content": chunk
-                })
-        
-        # Add assistant message to history
+        # Add assistant message to history. Sources are kept as chunk IDs and
+        # resolved against the chunk store when the history is read.
         timestamp = datetime.now().isoformat()
         session_data["messages"].append({
             "role": "assistant",
             "content": watson_response if watson_response else "No response",
             "stages": {
-                "watson": watson_stage_data.dict() if watson_stage_data else None,
+                "watson": compact_watson_stage(watson_stage_data),
                 "simplified": simplified_answer,
-                "sources": sources_list
+                "source_ids": source_ids
             },
             "timestamp": timestamp
         })
         
-        return ChatResponse(
+        trace = current_trace()
+        response = ChatResponse(
             watson_stage=watson_stage_data,
             simplified_answer=simplified_answer,
-            sources=sources_list,
+            sources=sources,
             timestamp=timestamp,
             awaiting_followup=session_data["awaiting_followup"],
-            conversation_context=session_data["conversation_context"]
+            conversation_context=session_data["conversation_context"] if request.include_context else None,
+            degraded=degraded,
+            precomputed=precomputed_answer is not None,
+            timings=trace_timings(trace) if trace is not None else None
         )
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+    finally:
+        session_journal.turn(request.session_id, session_data, session_data["messages"][first_new_message:])
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """Answer a batch of standalone questions without a session.
+    
+    All questions are embedded in one encode call and searched with one
+    multi-query index search; answers are then generated with bounded
+    concurrency and streamed back as NDJSON lines in completion order.
+    """
+    search_targets = collections_for(request.collections or [request.collection])
+    if not any(collection.exists() for collection in search_targets):
+        raise HTTPException(status_code=400, detail="No documents indexed. Please upload documents first.")
+    
+    all_hits = await asyncio.to_thread(retrieve_batch, request.questions, search_targets, request.k)
+    semaphore = asyncio.Semaphore(min(request.max_concurrency, BATCH_MAX_CONCURRENCY))
+    
+    async def answer(position: int):
+        question, hits = request.questions[position], all_hits[position]
+        result = {
+            "index": position,
+            "question": question,
+            "simplified_answer": None,
+            "sources": format_sources(hits)
+        }
+        if request.generate and hits:
+            context = "\n\n".join(hit["content"] for hit in hits)
+            async with semaphore:
+                try:
+                    # Batch work queues for its turn alongside interactive users instead of being shed
+                    async with generation_admission.slot(f"batch:{id(request)}", shed=False):
+                        result["simplified_answer"] = await asyncio.to_thread(
+                            generate_answer, build_answer_prompt("", context, question)
+                        )
+                except Exception as e:
+                    result["error"] = f"Answer generation error: {e}"
+        return result
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(answer(position)) for position in range(len(request.questions))]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # The client went away: stop generating answers nobody will read
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/chat/{session_id}")
+async def chat_socket(websocket: WebSocket, session_id: str):
+    """Chat over one connection bound to a session.
+    
+    The client sends {"question": ...} messages, with the same optional
+    fields as POST /chat, and gets "watson_stage", "sources" and "token"
+    events as each is produced, then "done" with the full /chat response.
+    Errors come back as "error" events and the connection stays open. Turns
+    are answered one at a time, in order. The server sends a "ping" every
+    WS_HEARTBEAT_SECONDS while idle, and the client may send {"type": "ping"}
+    for a "pong".
+    """
+    await websocket.accept()
+    session_data = active_sessions.get(session_id)
+    if session_data is None:
+        await websocket.close(code=4404, reason="Session not found. Create a session first.")
+        return
+    
+    # Events go through a bounded queue: when the client reads slowly the
+    # queue fills up and the turn waits, instead of buffering without limit
+    outbox = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+    
+    async def send_events():
+        while True:
+            await websocket.send_json(await outbox.get())
+            outbox.task_done()
+    
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            if outbox.empty():
+                outbox.put_nowait({"type": "ping", "timestamp": datetime.now().isoformat()})
+    
+    async def receive_turns():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await outbox.put({"type": "error", "status": 422, "detail": "Expected a JSON object"})
+                continue
+            if not isinstance(message, dict):
+                await outbox.put({"type": "error", "status": 422, "detail": "Expected a JSON object"})
+                continue
+            if message.get("type") == "pong":
+                continue
+            if message.get("type") == "ping":
+                await outbox.put({"type": "pong", "timestamp": datetime.now().isoformat()})
+                continue
+            if active_sessions.get(session_id) is not session_data:
+                await outbox.put({"type": "error", "status": 404, "detail": "Session was deleted"})
+                await outbox.join()
+                await websocket.close(code=4404)
+                return
+            
+            try:
+                request = ChatRequest(**{**message, "session_id": session_id})
+                response = await answer_turn(request, session_data, outbox.put)
+                await outbox.put({"type": "done", "response": json.loads(response.json())})
+            except ValidationError as e:
+                await outbox.put({"type": "error", "status": 422, "detail": e.errors()})
+            except HTTPException as e:
+                await outbox.put({"type": "error", "status": e.status_code, "detail": e.detail})
+    
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(heartbeat()), asyncio.create_task(receive_turns())]
+    try:
+        # Runs until the client disconnects, the session is deleted or a send fails
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+    for task in done:
+        error = task.exception()
+        if error is not None and not isinstance(error, WebSocketDisconnect):
+            print(f"⚠ WebSocket chat {session_id} closed: {error!r}")
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                # The connection is already gone
+                pass
 
 @app.get("/session/{session_id}/status", response_model=SessionStatus)
 async def get_session_status(session_id: str):
@@ -526,16 +1333,81 @@ async def get_session_status(session_id: str):
         chat_session_started=session_data.get("chat_session_started", False)
     )
 
+HISTORY_FIELDS = ("role", "content", "timestamp", "stages")
+
+def expand_history_message(message, fields):
+    """Project a stored history message onto the requested fields, resolving
+    source chunk IDs only when the stages are requested"""
+    expanded = {
+        field: message[field]
+        for field in HISTORY_FIELDS
+        if field in fields and field in message and field != "stages"
+    }
+    
+    if "stages" in fields and "stages" in message:
+        stages = message["stages"]
+        expanded["stages"] = {
+            "watson": expand_watson_stage(stages.get("watson"), message["content"]),
+            "simplified": stages.get("simplified"),
+            "sources": build_sources(stages.get("source_ids", []))
+        }
+    return expanded
+
+@app.get("/chunks/{chunk_id}")
+async def get_chunk(chunk_id: str):
+    """Fetch one retrieved chunk by the ID returned in sources"""
+    chunks = await asyncio.to_thread(build_sources, [chunk_id])
+    if not chunks:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    
+    chunk = chunks[0]
+    chunk.pop("source_number")
+    return JSONResponse(chunk)
+
 @app.get("/chat/history/{session_id}")
-async def get_chat_history(session_id: str):
-    """Get full chat history"""
+async def get_chat_history(
+    request: Request,
+    session_id: str,
+    cursor: int = Query(0, ge=0, description="Position of the first message to return"),
+    limit: int = Query(50, ge=1, le=500),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of role,content,timestamp,stages")
+):
+    """Get chat history, one page at a time"""
     if session_id not in active_sessions:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return JSONResponse({
-        "session_id": session_id,
-        "messages": active_sessions[session_id]["messages"]
-    })
+    if fields:
+        selected = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = selected - set(HISTORY_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown history fields: {', '.join(sorted(unknown))}")
+    else:
+        selected = set(HISTORY_FIELDS)
+    
+    messages = active_sessions[session_id]["messages"]
+    
+    # History is append-only, so its length versions the session; sources
+    # are resolved against the chunk stores, so their versions count too
+    etag = make_etag(
+        session_id, len(messages), cursor, limit, sorted(selected),
+        index_versions() if "stages" in selected else None
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    page = messages[cursor:cursor + limit]
+    next_cursor = cursor + len(page)
+    # Resolving sources can read chunk stores from disk, so it runs off the event loop
+    expanded = await asyncio.to_thread(lambda: [expand_history_message(message, selected) for message in page])
+    return JSONResponse(
+        {
+            "session_id": session_id,
+            "messages": expanded,
+            "total_messages": len(messages),
+            "next_cursor": next_cursor if next_cursor < len(messages) else None
+        },
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 @app.delete("/session/{session_id}")
 async def delete_session(session_id: str):
@@ -548,61 +1420,173 @@ async def delete_session(session_id: str):
     
     if watson_assistant and watson_session_id:
         try:
-            watson_assistant['assistant'].delete_session(
-                assistant_id=watson_assistant['assistant_id'],
-                environment_id=watson_assistant['environment_id'],
-                session_id=watson_session_id
-            )
+            await asyncio.to_thread(end_watson_session, watson_session_id)
         except:
             pass
     
     del active_sessions[session_id]
+    session_journal.deleted(session_id)
     
     return JSONResponse({
         "status": "success",
         "message": "Session deleted successfully"
     })
 
+@app.get("/collections")
+async def get_collections():
+    """List collections with their index stats"""
+    return JSONResponse({
+        "collections": {name: get_collection(name).stats() for name in list_collections()}
+    })
+
+@app.get("/collections/{name}/documents")
+async def get_collection_documents(name: str):
+    """List a collection's documents with their chunk ID ranges, pages and upload time"""
+    target = collections_for([name])[0]
+    documents = await asyncio.to_thread(target.documents)
+    return JSONResponse({
+        "collection": target.name,
+        "version": target.version(),
+        "documents": documents
+    })
+
+_status_cache = {"etag": None, "payload": None}
+
 @app.get("/status")
-async def get_status():
+async def get_status(request: Request):
     """Get system status"""
-    index, chunks, metadata = load_or_create_vectorstore()
+    etag = make_etag(
+        index_versions(),
+        len(active_sessions),
+        watson_assistant is not None,
+        llm_model is not None,
+        simplification_model is not None,
+        sorted(generation_admission.stats().items()),
+        embedding_flights.stats(),
+        retrieval_flights.stats(),
+        generation_flights.stats(),
+        precomputed_answers.stats(),
+        watson_pool.stats() if watson_pool is not None else None,
+        session_journal.stats()
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if _status_cache["etag"] == etag:
+        return JSONResponse(_status_cache["payload"], headers={"ETag": etag, "Cache-Control": "no-cache"})
     
-    unique_docs = set()
-    if metadata:
-        for meta in metadata:
-            if 'source' in meta:
-                doc_name = Path(meta['source']).name
-                unique_docs.add(doc_name)
+    collection_stats = {name: get_collection(name).stats() for name in list_collections()}
+    default_stats = collection_stats[DEFAULT_COLLECTION]
     
-    return JSONResponse({
+    payload = {
         "watson_assistant": watson_assistant is not None,
         "llm_model": llm_model is not None,
         "simplification_model": simplification_model is not None,
         "index_status": {
-            "indexed": index is not None,
-            "total_chunks": len(chunks) if chunks else 0,
-            "documents": sorted(list(unique_docs))
+            "indexed": default_stats["indexed"],
+            "total_chunks": default_stats["total_chunks"],
+            "documents": default_stats["documents"]
         },
-        "active_sessions": len(active_sessions)
-    })
+        "collections": collection_stats,
+        "active_sessions": len(active_sessions),
+        "generation_admission": generation_admission.stats(),
+        "coalescing": {
+            "embedding": embedding_flights.stats(),
+            "retrieval": retrieval_flights.stats(),
+            "generation": generation_flights.stats()
+        },
+        "precomputed_answers": precomputed_answers.stats(),
+        "watson_pool": watson_pool.stats() if watson_pool is not None else None,
+        "session_journal": session_journal.stats()
+    }
+    _status_cache.update(etag=etag, payload=payload)
+    return JSONResponse(payload, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.delete("/clear")
-async def clear_index():
-    """Clear the document index"""
+async def clear_index(collection: str = Query(DEFAULT_COLLECTION)):
+    """Clear a collection's document index (its versions are kept for rollback)"""
+    target = collections_for([collection])[0]
+    
     try:
-        if Path("faiss_index").exists():
-            Path("faiss_index").unlink()
-        if Path("vector_data.json").exists():
-            Path("vector_data.json").unlink()
+        previous_version = target.version()
+        target.clear()
         
         return JSONResponse({
             "status": "success",
-            "message": "Index cleared successfully"
+            "message": f"Index for collection '{target.name}' cleared successfully",
+            "previous_version": previous_version
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error clearing index: {str(e)}")
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin endpoints are disabled unless a token is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=300),
+    mode: str = Query("sample", description="sample (every thread), cprofile (event loop only) or tracemalloc"),
+    format: str = Query("binary", description="binary (collapsed stacks/pstats/tracemalloc snapshot) or text")
+):
+    """Profile this worker for the given number of seconds and download the result"""
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile mode '{mode}'. Use one of: {', '.join(PROFILE_MODES)}")
+    try:
+        content, filename = await capture_profile(seconds, mode, text=format == "text")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return Response(
+        content,
+        media_type="text/plain" if format == "text" else "application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+class RollbackRequest(BaseModel):
+    version: str
+
+@app.get("/admin/collections/{name}/versions", dependencies=[Depends(require_admin)])
+async def get_collection_versions(name: str):
+    """List a collection's retained index versions, oldest first"""
+    target = collections_for([name])[0]
+    current = target.version()
+    return JSONResponse({
+        "collection": target.name,
+        "current": current,
+        "versions": [
+            {
+                "version": version,
+                "current": version == current,
+                "total_chunks": stats["total_chunks"],
+                "documents": stats["documents"],
+                "encoding": stats.get("encoding"),
+                "updated_at": stats.get("updated_at")
+            }
+            for version in target.versions()
+            for stats in [target.stats(version)]
+        ]
+    })
+
+@app.post("/admin/collections/{name}/rollback", dependencies=[Depends(require_admin)])
+async def rollback_collection(name: str, request: RollbackRequest):
+    """Publish a retained version; workers pick it up on their next query"""
+    target = collections_for([name])[0]
+    previous_version = target.version()
+    try:
+        target.publish(request.version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return JSONResponse({
+        "status": "success",
+        "collection": target.name,
+        "version": request.version,
+        "previous_version": previous_version
+    })
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
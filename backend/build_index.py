@@ -0,0 +1,163 @@
+"""Build an index bundle from a directory of PDFs, offline.
+
+Uses the same extraction, chunking and embedding code as /upload. PDFs are
+extracted and chunked in parallel (--jobs processes) and embedded on the
+embedding pool (--embed-workers). Every finished document is checkpointed
+under <output>.checkpoint, so an interrupted build resumes where it stopped;
+the checkpoint is removed once the bundle is written.
+
+A bundle is the files of one collection version (FAISS index, chunk store,
+float32 vectors, metadata index, stats) plus manifest.json recording the
+collection, embedding model, chunker and a bundle ID. Servers install
+bundles listed in INDEX_BUNDLES at startup without re-embedding anything.
+
+Usage:
+    python build_index.py pdfs/ --output bundles/tenancy --collection tenancy
+    python build_index.py pdfs/ --output bundles/tenancy --chunker legal --encoding sq8 --jobs 8
+    INDEX_BUNDLES=tenancy=bundles/tenancy python bhararth1.py
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import ingest
+from bhararth1 import EMBEDDING_MODEL
+from embedding_pool import EMBED_BATCH_SIZE, EmbeddingPool
+from vector_store import DEFAULT_COLLECTION, INDEX_ENCODINGS, write_bundle
+
+
+def extract_and_chunk(path: str, extractor, chunker):
+    """Chunk one PDF, returning (file hash, chunk texts, chunk metadata)"""
+    documents = ingest.load_documents([Path(path)], extractor)
+    chunks = ingest.split_documents(documents, chunker)
+    return ingest.file_hash(Path(path)), [chunk.page_content for chunk in chunks], [chunk.metadata for chunk in chunks]
+
+
+class Checkpoint:
+    """Per-document chunks and embeddings of an unfinished build"""
+
+    def __init__(self, directory: Path, config):
+        self.directory = directory
+        config_path = directory / "config.json"
+        if config_path.exists() and json.loads(config_path.read_text()) != config:
+            print(f"Build settings changed since {directory} was written, starting over")
+            shutil.rmtree(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        config_path.write_text(json.dumps(config))
+
+    def _key(self, path: Path) -> str:
+        return hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+
+    def load(self, path: Path):
+        """Return (texts, metadata, embeddings) saved for a document, or None"""
+        base = self.directory / self._key(path)
+        if not (base.with_suffix(".json").exists() and base.with_suffix(".npy").exists()):
+            return None
+        data = json.loads(base.with_suffix(".json").read_text())
+        if data["hash"] != ingest.file_hash(path):
+            return None
+        return data["chunks"], data["metadata"], np.load(base.with_suffix(".npy"))
+
+    def save(self, path: Path, content_hash: str, texts, metadata, embeddings: np.ndarray):
+        base = self.directory / self._key(path)
+        # The embeddings are renamed into place last; they mark the document done
+        tmp_vectors = base.with_suffix(".npy.tmp")
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, embeddings)
+        base.with_suffix(".json").write_text(json.dumps({"hash": content_hash, "chunks": texts, "metadata": metadata}))
+        os.replace(tmp_vectors, base.with_suffix(".npy"))
+
+    def remove(self):
+        shutil.rmtree(self.directory)
+
+
+def build(args):
+    paths = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    if not paths:
+        raise SystemExit(f"no PDFs found in {args.pdf_dir}")
+    output = Path(args.output)
+    checkpoint = Checkpoint(output.with_name(output.name + ".checkpoint"), {
+        "model": EMBEDDING_MODEL, "chunker": args.chunker or ingest.DEFAULT_CHUNKER, "extractor": args.extractor
+    })
+
+    done = {path: checkpoint.load(path) for path in paths}
+    pending = [path for path in paths if done[path] is None]
+    print(f"{len(paths)} PDFs, {len(paths) - len(pending)} already checkpointed")
+
+    started = time.perf_counter()
+    if pending:
+        pool = EmbeddingPool(EMBEDDING_MODEL, args.embed_workers, args.batch_size) if args.embed_workers > 1 else None
+        embedder = None
+        if pool is None:
+            from sentence_transformers import SentenceTransformer
+            embedder = SentenceTransformer(EMBEDDING_MODEL)
+        try:
+            # spawn: the model (and torch) may already be loaded here, and
+            # forking a process that runs its threads is not safe
+            with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(extract_and_chunk, str(path), args.extractor, args.chunker) for path in pending]
+                for path, future in zip(pending, futures):
+                    content_hash, texts, metadata = future.result()
+                    document_started = time.perf_counter()
+                    if not texts:
+                        embeddings = np.zeros((0, 0), dtype="float32")
+                    elif pool is not None:
+                        embeddings = pool.encode(texts)
+                    else:
+                        embeddings = np.asarray(embedder.encode(texts, convert_to_numpy=True), dtype="float32")
+                    checkpoint.save(path, content_hash, texts, metadata, embeddings)
+                    done[path] = (texts, metadata, embeddings)
+                    rate = len(texts) / max(time.perf_counter() - document_started, 1e-9)
+                    print(f"  {path.name}: {len(texts)} chunks ({rate:.1f} chunks/s)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    chunks, metadata, vectors = [], [], []
+    for path in paths:
+        texts, meta, embeddings = done[path]
+        chunks.extend(texts)
+        metadata.extend(meta)
+        if len(texts):
+            vectors.append(embeddings)
+    if not chunks:
+        raise SystemExit("no text could be extracted from the PDFs")
+
+    if output.exists():
+        shutil.rmtree(output)
+    manifest = write_bundle(output, {
+        "collection": args.collection,
+        "chunker": args.chunker or ingest.DEFAULT_CHUNKER,
+        "extractor": args.extractor or "auto"
+    }, chunks, metadata, np.vstack(vectors), EMBEDDING_MODEL, args.encoding)
+    checkpoint.remove()
+
+    seconds = time.perf_counter() - started
+    print(f"Wrote {output}: {manifest['total_chunks']} chunks from {len(paths)} PDFs, "
+          f"{manifest['encoding']} encoding, bundle {manifest['bundle_id']} ({seconds:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an index bundle from a directory of PDFs")
+    parser.add_argument("pdf_dir", help="directory of PDFs to index")
+    parser.add_argument("--output", required=True, help="bundle directory to write")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="collection the bundle is installed into")
+    parser.add_argument("--chunker", choices=ingest.CHUNKERS, help="chunker (default: CHUNKER)")
+    parser.add_argument("--extractor", choices=list(ingest.EXTRACTORS), help="PDF extractor (default: fastest installed)")
+    parser.add_argument("--encoding", choices=INDEX_ENCODINGS, help="index encoding (default: INDEX_ENCODING)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processes extracting and chunking PDFs")
+    parser.add_argument("--embed-workers", type=int, default=min(4, os.cpu_count() or 1), help="embedding processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="texts per embedding task")
+    build(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Single-flight coalescing of identical concurrent work.
+
+When many users ask the same question at once, the first caller for a key
+starts the work and everyone else arriving while it is in flight awaits the
+same result. Once the work finishes the key is forgotten; this is
+deduplication of concurrent calls, not a cache.
+
+Cancelling one caller never cancels the shared work while other callers are
+still waiting for it; the work is only cancelled once every caller has gone.
+"""
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case and collapse whitespace and trailing punctuation so trivially different phrasings share a key"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]):
+        """Run work() for key, or join the run already in flight for it"""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None or flight.task.cancelled() or flight.task.cancelling():
+            # Work abandoned by all of its callers is not joined, it is restarted
+            self.executions += 1
+            flight = _Flight(asyncio.ensure_future(work()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        coalesced = self.calls - self.executions
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": round(coalesced / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._flights)
+        }
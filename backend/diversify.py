@@ -0,0 +1,70 @@
+"""Result diversification for retrieval.
+
+Neighbouring chunks overlap by 200 characters, so a plain top-k often
+returns the same passage of one page several times. Searches fetch a larger
+candidate set and pick from it with maximal marginal relevance (MMR): each
+pick maximises ``lambda * relevance - (1 - lambda) * similarity to the
+chunks already picked``, computed with one candidate-by-candidate cosine
+matrix. With adaptive k, candidates whose distance is more than
+max_distance_ratio times the best hit's are dropped first, so a question
+with one clearly relevant chunk gets one chunk rather than k.
+"""
+import os
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+
+# 1.0 ranks by relevance alone
+MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+# Relative to the best hit's squared L2 distance; 0 always returns k chunks
+MAX_DISTANCE_RATIO = float(os.getenv("RETRIEVAL_MAX_DISTANCE_RATIO", "1.5"))
+# Candidates fetched per query for MMR to choose from
+MMR_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "12"))
+
+
+class Diversity(NamedTuple):
+    mmr_lambda: float = MMR_LAMBDA
+    max_distance_ratio: float = MAX_DISTANCE_RATIO
+    candidates: int = MMR_CANDIDATES
+
+    def active(self) -> bool:
+        return self.mmr_lambda < 1.0 or self.max_distance_ratio > 0
+
+
+DEFAULT_DIVERSITY = Diversity()
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def mmr_select(query: np.ndarray, vectors: np.ndarray, k: int, mmr_lambda: float) -> List[int]:
+    """Positions of the k candidate vectors picked by MMR, in pick order"""
+    unit = _unit_rows(np.asarray(vectors, dtype="float32"))
+    relevance = unit @ _unit_rows(np.asarray(query, dtype="float32"))
+    similarity = unit @ unit.T
+
+    picked = [int(np.argmax(relevance))]
+    # Similarity of every candidate to its closest picked chunk
+    redundancy = similarity[picked[0]].copy()
+    available = np.ones(len(unit), dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, len(unit)):
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        picked.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return picked
+
+
+def diversify(query: np.ndarray, hits: List[Dict[str, Any]], k: int, diversity: Diversity) -> List[Dict[str, Any]]:
+    """Pick up to k of the candidate hits (sorted by distance, each carrying its
+    "vector"), returning them without the vectors"""
+    if hits and diversity.max_distance_ratio > 0:
+        cutoff = max(hits[0]["distance"], 1e-6) * diversity.max_distance_ratio
+        hits = [hit for hit in hits if hit["distance"] <= cutoff]
+    if len(hits) > 1 and diversity.mmr_lambda < 1.0:
+        picked = mmr_select(query, np.stack([hit["vector"] for hit in hits]), k, diversity.mmr_lambda)
+        hits = [hits[position] for position in picked]
+    return [{key: value for key, value in hit.items() if key != "vector"} for hit in hits[:k]]
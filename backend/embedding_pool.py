@@ -0,0 +1,165 @@
+"""Multi-process embedding for bulk ingestion.
+
+A single ``encode()`` call keeps one process busy while the other cores sit
+idle. EmbeddingPool shards the texts into batches of EMBED_BATCH_SIZE and
+encodes them on EMBED_WORKERS spawned processes, each loading the model once
+and limited to its share of the CPU threads. Workers write their rows
+straight into one shared-memory float32 array instead of pickling results
+back, so the parent only sends text.
+
+Small jobs (fewer than EMBED_POOL_MIN_CHUNKS texts) are encoded in-process,
+where starting workers would cost more than it saves.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_POOL_MIN_CHUNKS = int(os.getenv("EMBED_POOL_MIN_CHUNKS", "2000"))
+
+# Set in each worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _worker_dimension() -> int:
+    return int(_worker_model.get_sentence_embedding_dimension())
+
+
+def _encode_into(shm_name: str, shape, start: int, texts: List[str]) -> int:
+    """Encode texts into rows start.. of the shared array"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype="float32", buffer=shm.buf)
+        out[start:start + len(texts)] = _worker_model.encode(texts, batch_size=64, convert_to_numpy=True)
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool:
+    def __init__(self, model_name: str, workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dimension: Optional[int] = None
+        self._lock = threading.Lock()
+        self.last_run: Dict[str, Any] = {}
+
+    def _start(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads (and
+                # possibly torch) is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, max(1, (os.cpu_count() or 1) // self.workers))
+                )
+                self._dimension = self._executor.submit(_worker_dimension).result()
+            return self._executor
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts across the worker processes, one float32 row per text"""
+        executor = self._start()
+        started = time.perf_counter()
+        shape = (len(texts), self._dimension)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts) * self._dimension * 4))
+        try:
+            futures = [
+                executor.submit(_encode_into, shm.name, shape, start, texts[start:start + self.batch_size])
+                for start in range(0, len(texts), self.batch_size)
+            ]
+            for future in futures:
+                future.result()
+            embeddings = np.array(np.ndarray(shape, dtype="float32", buffer=shm.buf))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        seconds = time.perf_counter() - started
+        self.last_run = {
+            "chunks": len(texts),
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(len(texts) / seconds, 1) if seconds else None
+        }
+        return embeddings
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_pool: Optional[EmbeddingPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_embedding_pool(model_name: str) -> EmbeddingPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.model_name != model_name:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = EmbeddingPool(model_name)
+        return _pool
+
+
+def shutdown_embedding_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+
+
+def embed_documents(texts: List[str], model_name: str, embedder=None):
+    """Embed chunk texts for indexing, on the worker pool for large jobs.
+
+    Returns (embeddings, throughput stats). embedder is the in-process model
+    used for small jobs and as the fallback if the pool fails.
+    """
+    if EMBED_WORKERS > 1 and len(texts) >= EMBED_POOL_MIN_CHUNKS:
+        pool = get_embedding_pool(model_name)
+        try:
+            return pool.encode(texts), pool.last_run
+        except (BrokenProcessPool, OSError) as e:
+            print(f"⚠ Embedding pool failed ({e}), embedding in-process")
+            pool.shutdown()
+
+    if embedder is None:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name)
+    started = time.perf_counter()
+    embeddings = np.asarray(embedder.encode(texts, batch_size=64, convert_to_numpy=True), dtype="float32")
+    embeddings = embeddings.reshape(len(texts), -1)
+    seconds = time.perf_counter() - started
+    return embeddings, {
+        "chunks": len(texts),
+        "workers": 1,
+        "batch_size": len(texts),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(len(texts) / seconds, 1) if seconds else None
+    }
@@ -0,0 +1,188 @@
+"""Evaluate retrieval quality and latency over a labelled question set.
+
+Each line of the questions file is a JSON object such as::
+
+    {"question": "Who pays the land revenue?", "expected": [{"document": "tenancy_act.pdf", "page": 12}]}
+
+``expected`` may also be given as top-level ``document``/``page`` keys; an
+expected entry without a page matches any page of that document. Pages are
+compared with the ``page`` stored in chunk metadata (0-based for PDFs parsed
+by pypdf) unless --one-based-pages is given.
+
+Questions go through ``retrieve()``, the same path /chat uses. Every
+configuration is a JSON object holding the keyword arguments for one run,
+e.g. ``{"collections": ["default"], "k": 5}``; a ``diversity`` object holds
+the fields of diversify.Diversity. Passing two configurations prints them side
+by side with the difference.
+
+Usage:
+    python evaluate_retrieval.py questions.jsonl
+    python evaluate_retrieval.py questions.jsonl \\
+        --config baseline='{"collections": ["default"]}' \\
+        --config sq8='{"collections": ["default_sq8"]}' --output report.json
+    python evaluate_retrieval.py questions.jsonl \\
+        --config top3='{"diversity": {"mmr_lambda": 1.0, "max_distance_ratio": 0}}' \\
+        --config mmr='{"k": 5}'
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+import bhararth1
+from diversify import Diversity
+from vector_store import DEFAULT_COLLECTION, get_collection
+
+
+def load_questions(path: str, one_based_pages: bool) -> List[Dict[str, Any]]:
+    questions = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            expected = item.get("expected")
+            if expected is None:
+                expected = [{"document": item["document"], "page": item.get("page")}]
+            for entry in expected:
+                if entry.get("page") is not None and one_based_pages:
+                    entry["page"] = int(entry["page"]) - 1
+            if not expected:
+                raise ValueError(f"{path}:{line_number}: question has no expected document")
+            questions.append({"question": item["question"], "expected": expected})
+    return questions
+
+
+def parse_config(value: str):
+    name, _, options = value.partition("=")
+    if not options:
+        raise argparse.ArgumentTypeError("configs look like NAME='{\"collections\": [\"default\"]}'")
+    return name, json.loads(options)
+
+
+def _matches(hit: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    meta = hit["metadata"]
+    if Path(meta.get("source", "")).name != expected["document"]:
+        return False
+    if expected.get("page") is None:
+        return True
+    # Section-aware chunks can span several pages
+    first_page = meta.get("page")
+    return first_page is not None and first_page <= expected["page"] <= meta.get("page_end", first_page)
+
+
+def evaluate(questions: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+    options = dict(options)
+    k = options.pop("k", 3)
+    collections = [get_collection(name) for name in options.pop("collections", [DEFAULT_COLLECTION])]
+    if "diversity" in options:
+        options["diversity"] = Diversity(**options["diversity"])
+
+    for collection in collections:
+        stats = collection.stats()
+        if stats.get("embedding_model") not in (None, bhararth1.EMBEDDING_MODEL):
+            print(f"⚠ Collection '{collection.name}' was built with {stats['embedding_model']}, "
+                  f"queries use {bhararth1.EMBEDDING_MODEL}", file=sys.stderr)
+
+    # Load the embedder and indexes before timing anything
+    bhararth1.retrieve(questions[0]["question"], collections, k=k, **options)
+
+    latencies, recalls, precisions, reciprocal_ranks, chunk_counts, per_query = [], [], [], [], [], []
+    for item in questions:
+        started = time.perf_counter()
+        hits = bhararth1.retrieve(item["question"], collections, k=k, **options)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        found = [any(_matches(hit, expected) for hit in hits) for expected in item["expected"]]
+        recall = sum(found) / len(found)
+        relevant_hits = sum(any(_matches(hit, e) for e in item["expected"]) for hit in hits)
+        precision = relevant_hits / len(hits) if hits else 0.0
+        first_relevant = next(
+            (rank for rank, hit in enumerate(hits, 1) if any(_matches(hit, e) for e in item["expected"])),
+            None
+        )
+        reciprocal_rank = 1 / first_relevant if first_relevant else 0.0
+
+        latencies.append(latency_ms)
+        recalls.append(recall)
+        precisions.append(precision)
+        reciprocal_ranks.append(reciprocal_rank)
+        chunk_counts.append(len(hits))
+        per_query.append({
+            "question": item["question"],
+            "recall_at_k": recall,
+            "precision_at_k": precision,
+            "reciprocal_rank": reciprocal_rank,
+            "latency_ms": round(latency_ms, 3),
+            "retrieved": [hit["chunk_id"] for hit in hits]
+        })
+
+    latencies = np.array(latencies)
+    return {
+        "k": k,
+        "queries": len(questions),
+        "metrics": {
+            "k": k,
+            "recall_at_k": float(np.mean(recalls)),
+            "precision_at_k": float(np.mean(precisions)),
+            "mrr": float(np.mean(reciprocal_ranks)),
+            "chunks_per_query": float(np.mean(chunk_counts)),
+            "latency_mean_ms": float(latencies.mean()),
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p90_ms": float(np.percentile(latencies, 90)),
+            "latency_p99_ms": float(np.percentile(latencies, 99)),
+            "latency_max_ms": float(latencies.max())
+        },
+        "per_query": per_query
+    }
+
+
+def print_report(results: Dict[str, Dict[str, Any]]):
+    names = list(results)
+    metric_names = list(results[names[0]]["metrics"])
+
+    header = ["metric"] + names + (["diff"] if len(names) == 2 else [])
+    rows = []
+    for metric in metric_names:
+        values = [results[name]["metrics"][metric] for name in names]
+        row = [metric] + [f"{value:.4f}" for value in values]
+        if len(names) == 2:
+            row.append(f"{values[1] - values[0]:+.4f}")
+        rows.append(row)
+
+    widths = [max(len(str(row[column])) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval recall, MRR and latency")
+    parser.add_argument("questions", help="JSONL file of labelled questions")
+    parser.add_argument("--config", action="append", type=parse_config, default=[],
+                        help="NAME=JSON retrieval options; repeat to compare configurations")
+    parser.add_argument("--one-based-pages", action="store_true",
+                        help="expected pages are numbered from 1")
+    parser.add_argument("--output", help="write the full report, including per-query results, as JSON")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions, args.one_based_pages)
+    if not questions:
+        parser.error("no questions to evaluate")
+
+    configs = args.config or [("default", {"collections": [DEFAULT_COLLECTION]})]
+    results = {name: evaluate(questions, options) for name, options in configs}
+    for name, options in configs:
+        results[name]["config"] = options
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""PDF ingestion for the Legal RAG Navigator.
+
+Text is extracted page by page through a pluggable extractor. pypdf is always
+available and is the fallback; faster local backends (pypdfium2, PyMuPDF) are
+used when installed. Extracted pages are cached under PDF_CACHE_DIR keyed by
+the SHA-256 of the file contents, so re-uploading a PDF or re-chunking an
+existing corpus skips parsing entirely.
+"""
+import abc
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from vector_store import DATA_DIR
+
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", str(DATA_DIR / "pdf_cache")))
+
+# Tried in order when no extractor is requested
+AUTO_EXTRACTOR_ORDER = [
+    name.strip() for name in os.getenv("PDF_EXTRACTORS", "pypdfium2,pymupdf,pypdf").split(",") if name.strip()
+]
+
+
+class PdfExtractor(abc.ABC):
+    """Turns a PDF file into a list of page texts"""
+
+    name = ""
+
+    @classmethod
+    @abc.abstractmethod
+    def available(cls) -> bool:
+        """Whether the backing library is installed"""
+
+    @abc.abstractmethod
+    def extract_pages(self, path: Path) -> List[str]:
+        """Text of every page, in order"""
+
+
+class PypdfExtractor(PdfExtractor):
+    name = "pypdf"
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import pypdf  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def extract_pages(self, path: Path) -> List[str]:
+        from pypdf import PdfReader
+
+        return [page.extract_text() or "" for page in PdfReader(str(path)).pages]
+
+
+class Pdfium2Extractor(PdfExtractor):
+    name = "pypdfium2"
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import pypdfium2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def extract_pages(self, path: Path) -> List[str]:
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(str(path))
+        try:
+            return [pdf[number].get_textpage().get_text_range() for number in range(len(pdf))]
+        finally:
+            pdf.close()
+
+
+class PyMuPdfExtractor(PdfExtractor):
+    name = "pymupdf"
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import fitz  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def extract_pages(self, path: Path) -> List[str]:
+        import fitz
+
+        with fitz.open(str(path)) as pdf:
+            return [page.get_text() for page in pdf]
+
+
+EXTRACTORS: Dict[str, Type[PdfExtractor]] = {
+    extractor.name: extractor for extractor in (PypdfExtractor, Pdfium2Extractor, PyMuPdfExtractor)
+}
+FALLBACK_EXTRACTOR = PypdfExtractor.name
+
+
+def available_extractors() -> List[str]:
+    return [name for name, extractor in EXTRACTORS.items() if extractor.available()]
+
+
+def select_extractor(name: Optional[str] = None) -> PdfExtractor:
+    """Return the named extractor, or the first available one from PDF_EXTRACTORS"""
+    if name and name != "auto":
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown PDF extractor {name!r}; expected one of {', '.join(EXTRACTORS)}")
+        if not EXTRACTORS[name].available():
+            raise ValueError(f"PDF extractor {name!r} is not installed")
+        return EXTRACTORS[name]()
+
+    for candidate in AUTO_EXTRACTOR_ORDER:
+        if candidate in EXTRACTORS and EXTRACTORS[candidate].available():
+            return EXTRACTORS[candidate]()
+    return PypdfExtractor()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(content_hash: str) -> Path:
+    return PDF_CACHE_DIR / content_hash[:2] / f"{content_hash}.json"
+
+
+def extract_pdf(path: Path, extractor: Optional[str] = None, use_cache: bool = True) -> Dict:
+    """Extract the pages of one PDF.
+
+    Returns {"hash", "extractor", "pages", "cached"}. A cached extraction is
+    reused unless a different extractor was asked for explicitly. If the
+    chosen extractor fails on this file, pypdf is tried before giving up.
+    """
+    path = Path(path)
+    content_hash = file_hash(path)
+    cache_path = _cache_path(content_hash)
+
+    if use_cache and cache_path.exists():
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if extractor in (None, "auto", cached["extractor"]):
+            return {"hash": content_hash, "extractor": cached["extractor"], "pages": cached["pages"], "cached": True}
+
+    chosen = select_extractor(extractor)
+    try:
+        pages = chosen.extract_pages(path)
+    except Exception as e:
+        if chosen.name == FALLBACK_EXTRACTOR:
+            raise
+        print(f"⚠ {chosen.name} could not read {path.name} ({e}), falling back to {FALLBACK_EXTRACTOR}")
+        chosen = EXTRACTORS[FALLBACK_EXTRACTOR]()
+        pages = chosen.extract_pages(path)
+
+    if use_cache:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"extractor": chosen.name, "pages": pages}, f)
+        os.replace(tmp_path, cache_path)
+
+    return {"hash": content_hash, "extractor": chosen.name, "pages": pages, "cached": False}
+
+
+def load_documents(paths: List[Path], extractor: Optional[str] = None, use_cache: bool = True):
+    """Load PDFs as one LangChain Document per page with source/page metadata,
+    matching what PyPDFDirectoryLoader produced"""
+    from langchain_core.documents import Document
+
+    documents = []
+    for path in sorted(Path(path) for path in paths):
+        extracted = extract_pdf(path, extractor, use_cache)
+        for number, text in enumerate(extracted["pages"]):
+            documents.append(Document(page_content=text, metadata={"source": str(path), "page": number}))
+    return documents
+
+
+# Structure-aware chunking for statutes, rules and gazette notifications.
+# Headings open a new unit; sub-sections and clauses are only used as split
+# points when a section is too long to be one chunk.
+CHUNKERS = ("recursive", "legal")
+DEFAULT_CHUNKER = os.getenv("CHUNKER", "recursive")
+LEGAL_CHUNK_MAX_CHARS = int(os.getenv("LEGAL_CHUNK_MAX_CHARS", "1500"))
+LEGAL_CHUNK_MIN_CHARS = int(os.getenv("LEGAL_CHUNK_MIN_CHARS", "300"))
+# Continuation chunks are prefixed with the section number and at most this
+# much of its title, not the whole first line (often a full paragraph)
+HEADING_PREFIX_MAX_CHARS = 80
+
+_CHAPTER_PATTERN = re.compile(r"^\s*(CHAPTER|PART)\s+([IVXLC]+|\d+)\b.*$", re.IGNORECASE)
+_SCHEDULE_PATTERN = re.compile(r"^\s*((THE\s+)?([A-Z]+\s+)?SCHEDULE)\b.*$")
+_SECTION_PATTERN = re.compile(r"^\s*(?:Section\s+|Sec\.\s*|Rule\s+)?(\d+[A-Z]?)\.\s+(\S.*)$")
+_SUBSECTION_PATTERN = re.compile(r"^\s*\((\d+[A-Za-z]?|[a-z]{1,4})\)\s+")
+
+
+def _section_units(pages: List[str]):
+    """Group the lines of one document into headed units with their start/end pages"""
+    units = []
+    chapter = None
+    current = {"chapter": None, "section": None, "heading": None, "schedule": False,
+               "page": 0, "page_end": 0, "lines": []}
+
+    def start_unit(**fields):
+        nonlocal current
+        if any(line.strip() for line in current["lines"]):
+            units.append(current)
+        current = {"chapter": chapter, "section": None, "heading": None,
+                   "schedule": current["schedule"], "lines": [], **fields}
+        current["page_end"] = current["page"]
+
+    for number, text in enumerate(pages):
+        for line in text.splitlines():
+            if _CHAPTER_PATTERN.match(line):
+                chapter = line.strip()
+                start_unit(page=number, heading=chapter, schedule=False)
+            elif _SCHEDULE_PATTERN.match(line):
+                chapter = line.strip()
+                start_unit(page=number, heading=chapter, schedule=True)
+            else:
+                section = _SECTION_PATTERN.match(line)
+                if section and not current["schedule"]:
+                    start_unit(page=number, section=section.group(1), heading=line.strip())
+            current["lines"].append(line)
+            current["page_end"] = number
+    start_unit(page=len(pages))
+    return units
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Greedily join consecutive pieces into chunks of at most max_chars"""
+    packed, buffer = [], ""
+    for piece in pieces:
+        if buffer and len(buffer) + len(piece) + 1 > max_chars:
+            packed.append(buffer)
+            buffer = ""
+        buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer:
+        packed.append(buffer)
+    return packed
+
+
+def _heading_prefix(unit) -> str:
+    """A short "[12. Title...]" label for the continuation chunks of a unit"""
+    heading = unit["heading"]
+    if not heading:
+        return ""
+    section = _SECTION_PATTERN.match(heading)
+    if section and unit["section"] == section.group(1):
+        number, title = f"{section.group(1)}. ", section.group(2)
+    else:
+        number, title = "", heading
+    if len(title) > HEADING_PREFIX_MAX_CHARS:
+        title = title[:HEADING_PREFIX_MAX_CHARS].rsplit(" ", 1)[0].rstrip(" ,;:") + "..."
+    return f"[{number}{title}]\n"
+
+
+def _split_unit(lines: List[str], max_chars: int, min_chars: int, reserve: int = 0) -> List[str]:
+    """Split a unit's text into chunks of at most max_chars, leaving room for a
+    reserve-character prefix on every chunk when the unit has to be split"""
+    text = "\n".join(lines).strip()
+    if len(text) <= max_chars:
+        return [text]
+    # Never let the prefix squeeze the chunks below half the limit
+    max_chars = max(max_chars - reserve, max_chars // 2, 1)
+
+    # Split at sub-section/clause starts, then fall back to a plain
+    # character split (without overlap) for pieces that are still too long
+    pieces, current = [], []
+    for line in lines:
+        if _SUBSECTION_PATTERN.match(line) and current:
+            pieces.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    pieces.append("\n".join(current).strip())
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # A piece shorter than min_chars (a heading, a one-line clause) is not
+    # indexed on its own but carried into the start of the next piece
+    small_pieces, carry = [], ""
+    for piece in pieces:
+        if not piece:
+            continue
+        if carry and len(carry) + 1 > max_chars // 2:
+            # Only with min_chars set close to max_chars
+            small_pieces.append(carry)
+            carry = ""
+        budget = max(max_chars - (len(carry) + 1 if carry else 0), 1)
+        if len(piece) > budget:
+            parts = RecursiveCharacterTextSplitter(chunk_size=budget, chunk_overlap=0).split_text(piece)
+        else:
+            parts = [piece]
+        if carry:
+            parts[0] = f"{carry}\n{parts[0]}"
+        carry = parts.pop() if len(parts[-1]) < min_chars else ""
+        small_pieces.extend(parts)
+    if carry:
+        if small_pieces and len(small_pieces[-1]) + len(carry) + 1 <= max_chars:
+            small_pieces[-1] = f"{small_pieces[-1]}\n{carry}"
+        else:
+            small_pieces.append(carry)
+    return _pack(small_pieces, max_chars)
+
+
+def split_legal_documents(documents, max_chars: int = LEGAL_CHUNK_MAX_CHARS, min_chars: int = LEGAL_CHUNK_MIN_CHARS):
+    """Chunk page Documents along chapter, section, sub-section and schedule boundaries.
+
+    Units shorter than min_chars are merged with the following unit of the
+    same chapter; a unit without a section (an act's title, a bare chapter
+    heading) is always merged into the next one, so headings are never
+    chunks of their own. Continuation chunks of a long section start with its
+    number and (shortened) title so they still retrieve on it. Chunks carry chapter/section/heading
+    metadata and the page range they span.
+    """
+    from langchain_core.documents import Document
+
+    pages_by_source: Dict[str, List[str]] = {}
+    for document in documents:
+        pages = pages_by_source.setdefault(document.metadata["source"], [])
+        page = document.metadata.get("page", len(pages))
+        pages.extend([""] * (page + 1 - len(pages)))
+        pages[page] = document.page_content
+
+    chunks = []
+    for source, pages in pages_by_source.items():
+        units = _section_units(pages)
+
+        merged = []
+        for unit in units:
+            previous = merged[-1] if merged else None
+            short = previous is not None and len("\n".join(previous["lines"])) < min_chars
+            fits = short and len("\n".join(previous["lines"] + unit["lines"])) <= max_chars
+            if short and (previous["section"] is None or (fits and previous["chapter"] == unit["chapter"])):
+                if previous["section"] is None:
+                    # A heading takes the section (and chapter) of the text it introduces
+                    previous["section"] = unit["section"]
+                    previous["heading"] = unit["heading"] or previous["heading"]
+                    previous["chapter"] = unit["chapter"]
+                    previous["schedule"] = unit["schedule"]
+                previous["lines"] = previous["lines"] + unit["lines"]
+                previous["page_end"] = unit["page_end"]
+                previous["heading"] = previous["heading"] or unit["heading"]
+            else:
+                merged.append(dict(unit))
+
+        for unit in merged:
+            metadata = {"source": source, "page": unit["page"], "page_end": unit["page_end"]}
+            for key in ("chapter", "section", "heading"):
+                if unit[key]:
+                    metadata[key] = unit[key]
+            if unit["schedule"]:
+                metadata["schedule"] = True
+
+            prefix = _heading_prefix(unit)
+            for position, text in enumerate(_split_unit(unit["lines"], max_chars, min_chars, len(prefix))):
+                if position and prefix:
+                    text = prefix + text
+                chunks.append(Document(page_content=text, metadata=dict(metadata)))
+    return chunks
+
+
+def split_documents(documents, chunker: Optional[str] = None):
+    """Split page Documents into chunks with the named chunker (default: CHUNKER)"""
+    chunker = chunker or DEFAULT_CHUNKER
+    if chunker not in CHUNKERS:
+        raise ValueError(f"Unknown chunker {chunker!r}; expected one of {', '.join(CHUNKERS)}")
+
+    if chunker == "legal":
+        return split_legal_documents(documents)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    return splitter.split_documents(documents)
@@ -0,0 +1,96 @@
+"""Local intent routing for chat turns.
+
+Questions are compared (cosine similarity, using the same sentence embedder
+as retrieval) with a small set of labelled exemplars. Greetings, thanks and
+goodbyes recognised with high confidence are answered locally, substantive
+legal questions go straight to the RAG stage, and anything the router is
+unsure about is left to Watson Assistant as before.
+"""
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "true").lower() in ("1", "true", "yes")
+LOCAL_REPLY_THRESHOLD = float(os.getenv("INTENT_LOCAL_THRESHOLD", "0.75"))
+RAG_ROUTE_THRESHOLD = float(os.getenv("INTENT_RAG_THRESHOLD", "0.5"))
+# The best label must beat the runner-up by this much to be trusted
+MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.05"))
+
+TRIVIAL_INTENTS = ("greeting", "thanks", "goodbye")
+LEGAL_INTENT = "legal_question"
+
+INTENT_EXEMPLARS: Dict[str, List[str]] = {
+    "greeting": [
+        "hi", "hello", "hey there", "good morning", "good afternoon", "good evening",
+        "namaste", "hello, how are you?", "hi, is anyone there?"
+    ],
+    "thanks": [
+        "thanks", "thank you", "thank you so much", "thanks a lot, that helps",
+        "that was helpful", "great, thanks", "ok thank you"
+    ],
+    "goodbye": [
+        "bye", "goodbye", "see you later", "that's all, bye", "I'm done, thanks bye",
+        "exit", "end the chat"
+    ],
+    LEGAL_INTENT: [
+        "How do I transfer land ownership to my son?",
+        "What documents do I need to register a sale deed?",
+        "Can my landlord evict me without notice?",
+        "How is land revenue calculated?",
+        "What are the rights of a tenant under the tenancy act?",
+        "How do I get a copy of my land record or patta?",
+        "What is the penalty for encroaching on government land?",
+        "How can I challenge a mutation entry?",
+        "Who inherits agricultural land if there is no will?",
+        "What is the ceiling limit on land holdings?"
+    ]
+}
+
+LOCAL_REPLIES = {
+    "greeting": "Hello! 👋 Ask me any question about land tenure laws.",
+    "thanks": "You're welcome! Is there anything else you'd like to know about land tenure laws?",
+    "goodbye": "Goodbye! Come back any time you have a question about land tenure laws."
+}
+
+
+class Route(NamedTuple):
+    # "local" (answer with LOCAL_REPLIES), "rag" (skip Watson, answer from
+    # documents) or "watson" (let Watson Assistant decide)
+    action: str
+    intent: Optional[str]
+    confidence: float
+
+
+class IntentRouter:
+    def __init__(self, embedder, exemplars: Dict[str, List[str]] = INTENT_EXEMPLARS):
+        self.labels = []
+        texts = []
+        for label, examples in exemplars.items():
+            self.labels.extend([label] * len(examples))
+            texts.extend(examples)
+        self.label_names = list(exemplars)
+        self.labels = np.array(self.labels)
+        self.exemplar_embeddings = _normalize(np.asarray(embedder.encode(texts, convert_to_numpy=True), dtype="float32"))
+
+    def classify(self, question_embedding: np.ndarray):
+        """Return (label, confidence, margin over the runner-up label)"""
+        similarities = self.exemplar_embeddings @ _normalize(question_embedding.reshape(1, -1))[0]
+        per_label = np.array([similarities[self.labels == label].max() for label in self.label_names])
+        order = np.argsort(per_label)[::-1]
+        best, runner_up = per_label[order[0]], per_label[order[1]]
+        return self.label_names[order[0]], float(best), float(best - runner_up)
+
+    def route(self, question_embedding: np.ndarray) -> Route:
+        label, confidence, margin = self.classify(question_embedding)
+        if margin >= MIN_MARGIN:
+            if label in TRIVIAL_INTENTS and confidence >= LOCAL_REPLY_THRESHOLD:
+                return Route("local", label, confidence)
+            if label == LEGAL_INTENT and confidence >= RAG_ROUTE_THRESHOLD:
+                return Route("rag", label, confidence)
+        return Route("watson", label, confidence)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -0,0 +1,134 @@
+"""Per-version metadata index for filtered search.
+
+Built when a collection version is written, it holds one row per chunk ID
+(document number, first and last page, upload time) as NumPy arrays, plus
+the document names. A set of SearchFilters is turned into a boolean mask over
+the chunk IDs with a few vectorised comparisons, and the mask is handed to
+FAISS as a bitmap ID selector, so the index only ever scores the chunks that
+pass the filters instead of post-filtering a top-k.
+"""
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+METADATA_INDEX_FILE = "metadata_index.npz"
+
+
+class SearchFilters(NamedTuple):
+    # Documents whose file name contains every word of one of these terms,
+    # e.g. "2023 amendment" matches "land_reforms_2023_amendment.pdf"
+    documents: Optional[Sequence[str]] = None
+    # Inclusive page range, numbered like the "page" of returned sources;
+    # a chunk matches if any page it spans is in range
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+    def active(self) -> bool:
+        return any(value is not None for value in self)
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class MetadataIndex:
+    def __init__(self, names: List[str], document: np.ndarray, page: np.ndarray, page_end: np.ndarray, uploaded: np.ndarray):
+        self.names = names
+        self.document = document
+        self.page = page
+        self.page_end = page_end
+        self.uploaded = uploaded
+
+    @classmethod
+    def build(cls, metadata: List[Dict[str, Any]], default_uploaded_at: str) -> "MetadataIndex":
+        names: List[str] = []
+        numbers: Dict[str, int] = {}
+        document = np.empty(len(metadata), dtype="int32")
+        page = np.empty(len(metadata), dtype="int32")
+        page_end = np.empty(len(metadata), dtype="int32")
+        uploaded = np.empty(len(metadata), dtype="float64")
+        for position, meta in enumerate(metadata):
+            name = Path(meta["source"]).name if "source" in meta else "Unknown"
+            if name not in numbers:
+                numbers[name] = len(names)
+                names.append(name)
+            document[position] = numbers[name]
+            page[position] = int(meta.get("page", -1))
+            page_end[position] = int(meta.get("page_end", page[position]))
+            uploaded[position] = _timestamp(meta.get("uploaded_at") or default_uploaded_at)
+        return cls(names, document, page, page_end, uploaded)
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(f, names=np.array(self.names, dtype=str), document=self.document,
+                     page=self.page, page_end=self.page_end, uploaded=self.uploaded)
+
+    @classmethod
+    def load(cls, path: Path) -> "MetadataIndex":
+        with np.load(path) as data:
+            return cls([str(name) for name in data["names"]], data["document"], data["page"], data["page_end"], data["uploaded"])
+
+    def __len__(self) -> int:
+        return len(self.document)
+
+    def match_documents(self, terms: Sequence[str]) -> List[int]:
+        """Numbers of the documents whose name contains every word of any of the terms"""
+        matched = []
+        for number, name in enumerate(self.names):
+            name_text = " ".join(_words(name))
+            if any(all(word in name_text for word in _words(term)) for term in terms):
+                matched.append(number)
+        return matched
+
+    def mask(self, filters: SearchFilters) -> Optional[np.ndarray]:
+        """Boolean mask of the chunk IDs passing the filters, or None if nothing is filtered"""
+        if not filters.active():
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if filters.documents is not None:
+            mask &= np.isin(self.document, self.match_documents(filters.documents))
+        if filters.page_from is not None:
+            mask &= self.page_end >= filters.page_from
+        if filters.page_to is not None:
+            mask &= self.page <= filters.page_to
+        if filters.uploaded_after is not None:
+            mask &= self.uploaded >= _timestamp(filters.uploaded_after)
+        if filters.uploaded_before is not None:
+            mask &= self.uploaded <= _timestamp(filters.uploaded_before)
+        return mask
+
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        """Per-document chunk ID ranges, page span and upload time"""
+        summary = {}
+        for number, name in enumerate(self.names):
+            ids = np.flatnonzero(self.document == number)
+            # Consecutive IDs collapse into [first, last] ranges
+            breaks = np.flatnonzero(np.diff(ids) != 1)
+            starts = np.concatenate([ids[:1], ids[breaks + 1]])
+            ends = np.concatenate([ids[breaks], ids[-1:]])
+            summary[name] = {
+                "chunks": int(len(ids)),
+                "id_ranges": [[int(start), int(end)] for start, end in zip(starts, ends)],
+                "pages": [int(self.page[ids].min()), int(self.page_end[ids].max())],
+                "uploaded_at": datetime.fromtimestamp(float(self.uploaded[ids].max())).isoformat()
+            }
+        return summary
+
+
+def id_selector(mask: np.ndarray):
+    """A FAISS bitmap selector for a mask; keep the returned bitmap alive while it is used"""
+    import faiss
+
+    bitmap = np.packbits(mask, bitorder="little")
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)), bitmap
@@ -0,0 +1,122 @@
+"""Precompute answers for the most frequently asked questions.
+
+Questions are mined from the question log written by /chat (and the log
+rotated out before it), grouped by the set of collections they were asked
+against and by their normalised text.
+For every set, the --top most frequent questions asked at least --min-count
+times are retrieved and answered exactly as /chat would for a first turn,
+and written to a lookup table that /chat serves instantly.
+
+Tables record the collection versions they were built from. Answers still
+valid for the published versions are reused, so a run only generates new
+questions, while a run after an upload or rollback regenerates the table.
+Run it from cron, or keep it running with --every.
+
+Usage:
+    python precompute_answers.py
+    python precompute_answers.py --top 500 --min-count 5 --days 30
+    python precompute_answers.py --every 3600
+"""
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import bhararth1
+import precomputed
+from coalesce import normalize_question
+from vector_store import get_collection
+
+
+def mine_questions(days: int):
+    """Return {collection names: Counter of normalised question} and the most common phrasing of each"""
+    since = (datetime.now() - timedelta(days=days)).isoformat() if days else ""
+    counts = defaultdict(Counter)
+    phrasings = defaultdict(Counter)
+    for path in precomputed.question_log_paths():
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash while it was being appended
+                        continue
+                    if record["timestamp"] < since:
+                        continue
+                    names = tuple(sorted(record["collections"]))
+                    key = normalize_question(record["question"])
+                    counts[names][key] += 1
+                    phrasings[key][record["question"].strip()] += 1
+        except FileNotFoundError:
+            pass
+    return counts, {key: phrasing.most_common(1)[0][0] for key, phrasing in phrasings.items()}
+
+
+def precompute(names, counts: Counter, phrasings, top: int, min_count: int, force: bool = False):
+    collections = [get_collection(name) for name in names]
+    versions = {collection.name: collection.version() for collection in collections}
+    if None in versions.values():
+        print(f"Skipping {'+'.join(names)}: not every collection is indexed")
+        return
+
+    existing = precomputed.read_table(list(names))
+    reusable = existing["entries"] if existing and existing["versions"] == versions and not force else {}
+
+    entries = {}
+    generated = 0
+    for key, count in counts.most_common(top):
+        if count < min_count:
+            break
+        if key in reusable:
+            entries[key] = {**reusable[key], "count": count}
+            continue
+
+        question = phrasings[key]
+        hits = bhararth1.retrieve(question, collections, k=3)
+        context = "\n\n".join(hit["content"] for hit in hits)
+        prompt = bhararth1.build_answer_prompt(f"User: {question}\n", context, question)
+        answer = bhararth1.generate_answer(prompt)
+        if answer is None:
+            raise SystemExit("No watsonx.ai model is configured; set WATSONX_API_KEY to precompute answers")
+        entries[key] = {
+            "question": question,
+            "answer": answer,
+            "chunk_ids": [hit["chunk_id"] for hit in hits],
+            "count": count
+        }
+        generated += 1
+
+    precomputed.write_table(list(names), versions, entries)
+    print(f"{'+'.join(names)}: {len(entries)} answers ({generated} generated) for versions {versions}")
+
+
+def run(args):
+    counts, phrasings = mine_questions(args.days)
+    if not counts:
+        print(f"No questions logged in {precomputed.QUESTION_LOG_PATH}")
+    for names, question_counts in counts.items():
+        precompute(names, question_counts, phrasings, args.top, args.min_count, args.force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute answers for frequently asked questions")
+    parser.add_argument("--top", type=int, default=200, help="questions to precompute per collection set")
+    parser.add_argument("--min-count", type=int, default=3, help="times a question must have been asked")
+    parser.add_argument("--days", type=int, default=30, help="only mine questions from the last N days (0: all)")
+    parser.add_argument("--force", action="store_true", help="regenerate answers that are still valid")
+    parser.add_argument("--every", type=float, help="keep running, refreshing the tables every N seconds")
+    args = parser.parse_args()
+
+    bhararth1.llm_model = bhararth1.init_llm()
+    bhararth1.simplification_model = bhararth1.init_simplification_model()
+    while True:
+        run(args)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
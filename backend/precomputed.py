@@ -0,0 +1,119 @@
+"""Question log and precomputed answers for frequently asked questions.
+
+/chat appends every question that reaches answer generation to a JSONL
+question log. Once the log grows past QUESTION_LOG_MAX_BYTES it is renamed
+to ``<path>.1`` (replacing the previous one) and started afresh, so the
+mined history is bounded to about twice that size. precompute_answers.py mines the log for the most frequent
+questions and stores their retrieved chunk IDs and simplified answers in one
+lookup table per set of collections, under PRECOMPUTED_DIR.
+
+A table records the collection versions it was built against and is only
+served while those versions are still published, so answers never outlive
+the index they were generated from; the next run of the job rebuilds them.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from coalesce import normalize_question
+from vector_store import DATA_DIR, Collection
+
+QUESTION_LOG_PATH = os.getenv("QUESTION_LOG_PATH", str(DATA_DIR / "question_log.jsonl"))
+QUESTION_LOG_MAX_BYTES = int(os.getenv("QUESTION_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+PRECOMPUTED_DIR = Path(os.getenv("PRECOMPUTED_DIR", str(DATA_DIR / "precomputed")))
+PRECOMPUTED_ANSWERS_ENABLED = os.getenv("PRECOMPUTED_ANSWERS", "true").lower() in ("1", "true", "yes")
+
+_log_lock = threading.Lock()
+
+
+def question_log_paths() -> List[str]:
+    """The rotated and current question logs, oldest first"""
+    return [QUESTION_LOG_PATH + ".1", QUESTION_LOG_PATH]
+
+
+def log_question(question: str, collections: List[str]):
+    """Append a question to the question log (disabled when QUESTION_LOG_PATH is empty).
+
+    Blocking; /chat runs it in a worker thread."""
+    if not QUESTION_LOG_PATH:
+        return
+    line = json.dumps({
+        "question": question,
+        "collections": collections,
+        "timestamp": datetime.now().isoformat()
+    })
+    with _log_lock:
+        with open(QUESTION_LOG_PATH, "a") as f:
+            f.write(line + "\n")
+            size = f.tell()
+        if QUESTION_LOG_MAX_BYTES and size > QUESTION_LOG_MAX_BYTES:
+            os.replace(QUESTION_LOG_PATH, QUESTION_LOG_PATH + ".1")
+
+
+def table_key(collection_names: List[str]) -> str:
+    return "+".join(sorted(collection_names))
+
+
+def table_path(collection_names: List[str]) -> Path:
+    return PRECOMPUTED_DIR / f"{table_key(collection_names)}.json"
+
+
+def write_table(collection_names: List[str], versions: Dict[str, Optional[str]], entries: Dict[str, Dict[str, Any]]):
+    path = table_path(collection_names)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"versions": versions, "generated_at": datetime.now().isoformat(), "entries": entries}, f)
+    os.replace(tmp_path, path)
+
+
+def read_table(collection_names: List[str]) -> Optional[Dict[str, Any]]:
+    path = table_path(collection_names)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class PrecomputedAnswers:
+    """The lookup tables, loaded on first use and reloaded when the job rewrites them"""
+
+    def __init__(self):
+        self._tables: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _table(self, collection_names: List[str]) -> Optional[Dict[str, Any]]:
+        path = table_path(collection_names)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._tables.get(path.name)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, read_table(collection_names))
+            except (OSError, ValueError) as e:
+                print(f"⚠ Could not read precomputed answers {path.name}: {e}")
+                return None
+            self._tables[path.name] = cached
+        return cached[1]
+
+    def lookup(self, question: str, collections: List[Collection]) -> Optional[Dict[str, Any]]:
+        """Return the precomputed {"answer", "chunk_ids"} for a question, or
+        None if there is none for the currently published collection versions"""
+        table = self._table([collection.name for collection in collections])
+        entry = None
+        if table is not None and table["versions"] == {collection.name: collection.version() for collection in collections}:
+            entry = table["entries"].get(normalize_question(question))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": PRECOMPUTED_ANSWERS_ENABLED, "hits": self.hits, "misses": self.misses}
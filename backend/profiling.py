@@ -0,0 +1,225 @@
+"""Opt-in request traces and on-demand profiling of a running worker.
+
+A request sent with an ``X-Debug-Trace: 1`` header (or ``?debug=trace``) gets
+a per-stage timing breakdown: stages record their wall time into a dict held
+in a context variable, which asyncio tasks and ``asyncio.to_thread`` workers
+inherit. The timings come back in a Server-Timing header, and endpoints can
+also return them in the body. Without the flag the context variable is None
+and ``stage()`` returns without timing anything.
+
+``capture_profile()`` profiles the worker for a number of seconds. The
+"sample" mode records the stacks of every thread every few milliseconds,
+so it sees the embedding, search, Watson and generation stages that run in
+``asyncio.to_thread`` workers; it returns collapsed stacks for flame graph
+tools or a plain-text summary. "cprofile" (event loop thread only) and
+"tracemalloc" return a file for ``python -m pstats`` or
+``tracemalloc.Snapshot.load``, or a plain-text summary.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+TRACE_HEADER = b"x-debug-trace"
+PROFILE_MODES = ("sample", "cprofile", "tracemalloc")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+
+# Leaf frames of threads waiting for work (idle pool workers, the event loop
+# in select), left out of samples so they do not drown out the real work
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+}
+
+_current_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("debug_trace", default=None)
+
+# Only one capture runs at a time; profilers are process-wide
+_profile_lock = asyncio.Lock()
+
+
+def current_trace() -> Optional[Dict[str, float]]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Add the wall time of the block to the current trace, if the request has one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace[name] = trace.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def mark_handler_done():
+    """Note when the endpoint returned, so the time spent serialising its response can be measured"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["_handler_done"] = time.perf_counter()
+
+
+def trace_timings(trace: Dict[str, float]) -> Dict[str, float]:
+    """The stage timings of a trace in milliseconds"""
+    return {name: round(ms, 2) for name, ms in trace.items() if not name.startswith("_")}
+
+
+def _wants_trace(scope) -> bool:
+    if b"debug=trace" in scope.get("query_string", b""):
+        return True
+    return any(name == TRACE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+
+
+class TraceMiddleware:
+    """Starts a trace for flagged requests and reports it in a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = {"_started": time.perf_counter()}
+        token = _current_trace.set(trace)
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if "_handler_done" in trace:
+                    trace["serialize"] = (now - trace["_handler_done"]) * 1000
+                trace["total"] = (now - trace["_started"]) * 1000
+                MutableHeaders(scope=message).append("Server-Timing", ", ".join(
+                    f"{name};dur={ms}" for name, ms in trace_timings(trace).items()
+                ))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _current_trace.reset(token)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_stacks(seconds: float, interval: float) -> Tuple[Counter, int]:
+    """Sample the stack of every other thread until the time is up, returning
+    ({(thread name, frame labels root first): samples}, sampling rounds)"""
+    stacks: Counter = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    rounds = 0
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stacks[(names.get(ident, str(ident)), tuple(reversed(labels)))] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def _sample_summary(stacks: Counter, rounds: int, top: int) -> str:
+    """Functions by the share of sampling rounds they were running in (total) and on top of the stack (self)"""
+    total, own = Counter(), Counter()
+    for (_, labels), count in stacks.items():
+        for label in set(labels):
+            total[label] += count
+        own[labels[-1]] += count
+    lines = [f"{rounds} sampling rounds, {sum(stacks.values())} busy thread samples", ""]
+    for title, counts in (("total", total), ("self", own)):
+        lines.append(f"{'samples':>8} {'%':>6}  {title}")
+        for label, count in counts.most_common(top):
+            lines.append(f"{count:>8} {100 * count / max(rounds, 1):>5.1f}%  {label}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+async def capture_profile(seconds: float, mode: str = "sample", text: bool = False, top: int = 50) -> Tuple[bytes, str]:
+    """Profile the worker for the given number of seconds, returning (content, filename).
+
+    cProfile only sees the event loop thread, which runs the request handlers;
+    work handed to worker threads shows up as the time spent awaiting it.
+    Sampling covers every thread.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}; expected one of {', '.join(PROFILE_MODES)}")
+    if _profile_lock.locked():
+        raise RuntimeError("A profile is already being captured")
+
+    async with _profile_lock:
+        if mode == "sample":
+            stacks, rounds = await asyncio.to_thread(_sample_stacks, seconds, PROFILE_SAMPLE_INTERVAL)
+            if text:
+                return _sample_summary(stacks, rounds, top).encode(), "profile.txt"
+            # One "thread;root;...;leaf count" line per stack, as read by
+            # flamegraph.pl and speedscope
+            lines = [";".join((thread,) + labels) + f" {count}" for (thread, labels), count in stacks.items()]
+            return "\n".join(lines).encode(), "profile.folded"
+
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            if text:
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+                return out.getvalue().encode(), "profile.txt"
+            return _dump(profiler.dump_stats), "profile.pstats"
+
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        try:
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        if text:
+            lines = [str(statistic) for statistic in snapshot.statistics("lineno")[:top]]
+            return "\n".join(lines).encode(), "tracemalloc.txt"
+        return _dump(snapshot.dump), "tracemalloc.snapshot"
+
+
+def _dump(write) -> bytes:
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        write(path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(path)
@@ -0,0 +1,227 @@
+"""Write-ahead journal of chat sessions, replayed on startup.
+
+Sessions live in memory, so without a journal every restart (each deploy on
+Render) loses them. Every session change (create, a turn's new messages and
+state, delete) is queued as a record and a background thread appends it to
+``journal.jsonl`` under SESSION_JOURNAL_DIR.
+The thread collects the records arriving within SESSION_JOURNAL_FSYNC_INTERVAL
+and fsyncs them together, so requests never wait on the disk; a crash loses
+at most that interval.
+
+The thread also keeps the journaled state in memory. Once the journal grows
+past SESSION_JOURNAL_COMPACT_BYTES it writes that state to ``snapshot.json``
+and starts the journal afresh, which keeps replay time bounded. Records are
+numbered and the snapshot stores the last number it includes, so records
+still in the journal after a crash mid-compaction are not applied twice.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from vector_store import DATA_DIR
+
+SESSION_JOURNAL_ENABLED = os.getenv("SESSION_JOURNAL", "true").lower() in ("1", "true", "yes")
+SESSION_JOURNAL_DIR = Path(os.getenv("SESSION_JOURNAL_DIR", str(DATA_DIR / "sessions")))
+SESSION_JOURNAL_FSYNC_INTERVAL = float(os.getenv("SESSION_JOURNAL_FSYNC_INTERVAL", "0.05"))
+SESSION_JOURNAL_COMPACT_BYTES = int(os.getenv("SESSION_JOURNAL_COMPACT_BYTES", str(16 * 1024 * 1024)))
+
+JOURNAL_FILE = "journal.jsonl"
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _session_state(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything but the message history, copied so later changes do not leak into queued records"""
+    state = {key: value for key, value in session.items() if key != "messages"}
+    state["conversation_context"] = list(state.get("conversation_context") or [])
+    return state
+
+
+def _apply(sessions: Dict[str, Dict[str, Any]], record: Dict[str, Any]):
+    session_id = record["id"]
+    if record["op"] == "delete":
+        sessions.pop(session_id, None)
+        return
+    if record["op"] == "create":
+        sessions[session_id] = {"state": {}, "messages": []}
+    session = sessions.get(session_id)
+    if session is None:
+        return
+    if "state" in record:
+        session["state"] = record["state"]
+    session["messages"].extend(record.get("messages", []))
+
+
+def _fsync_directory(directory: Path):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SessionJournal:
+    def __init__(
+        self,
+        directory: Path = SESSION_JOURNAL_DIR,
+        fsync_interval: float = SESSION_JOURNAL_FSYNC_INTERVAL,
+        compact_bytes: int = SESSION_JOURNAL_COMPACT_BYTES
+    ):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        # The journaled state, only touched by the writer thread once it runs
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+        self.counters = {"records": 0, "fsyncs": 0, "compactions": 0, "errors": 0}
+
+    @property
+    def journal_path(self) -> Path:
+        return self.directory / JOURNAL_FILE
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.directory / SNAPSHOT_FILE
+
+    def open(self) -> Dict[str, Dict[str, Any]]:
+        """Replay the snapshot and journal, start the writer and return the recovered sessions"""
+        started = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            self._sessions, self._seq = snapshot["sessions"], snapshot["seq"]
+
+        replayed = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A write torn by the crash; nothing after it was fsynced
+                        break
+                    if record["seq"] <= self._seq:
+                        continue
+                    _apply(self._sessions, record)
+                    self._seq = record["seq"]
+                    replayed += 1
+        # Start from an empty journal, so nothing is appended after a torn line
+        if self.journal_path.exists() and self.journal_path.stat().st_size:
+            self._compact()
+
+        sessions = {}
+        for session_id, session in self._sessions.items():
+            state = dict(session["state"])
+            if state.get("query_vector") is not None:
+                total, weight = state["query_vector"]
+                state["query_vector"] = (np.array(total, dtype="float32"), float(weight))
+            sessions[session_id] = {**state, "messages": list(session["messages"])}
+        print(f"Recovered {len(sessions)} sessions ({replayed} journal records) in {time.perf_counter() - started:.2f}s")
+
+        self._thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        self._thread.start()
+        return sessions
+
+    def close(self):
+        """Write out everything queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def created(self, session_id: str, session: Dict[str, Any]):
+        self._record({"op": "create", "id": session_id, "state": _session_state(session), "messages": list(session["messages"])})
+
+    def turn(self, session_id: str, session: Dict[str, Any], new_messages: List[Dict[str, Any]]):
+        self._record({"op": "turn", "id": session_id, "state": _session_state(session), "messages": list(new_messages)})
+
+    def deleted(self, session_id: str):
+        self._record({"op": "delete", "id": session_id})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._thread is not None,
+            "pending": self._queue.qsize(),
+            "sessions": len(self._sessions),
+            **self.counters
+        }
+
+    def _record(self, record: Dict[str, Any]):
+        if self._thread is not None:
+            self._queue.put(record)
+
+    def _run(self):
+        log = open(self.journal_path, "a")
+        try:
+            while True:
+                # Everything arriving within the interval shares one fsync
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.fsync_interval
+                while batch[-1] is not None and (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                stopping = batch[-1] is None
+                records = [record for record in batch if record is not None]
+
+                try:
+                    for record in records:
+                        record["seq"] = self._seq + 1
+                        try:
+                            line = json.dumps(record, default=_encode)
+                        except (TypeError, ValueError) as e:
+                            self.counters["errors"] += 1
+                            print(f"⚠ Session journal record for {record['id']} skipped: {e}")
+                            continue
+                        log.write(line + "\n")
+                        self._seq += 1
+                        self.counters["records"] += 1
+                        _apply(self._sessions, record)
+                    log.flush()
+                    os.fsync(log.fileno())
+                    self.counters["fsyncs"] += 1
+                    if log.tell() > self.compact_bytes:
+                        log.close()
+                        self._compact()
+                        log = open(self.journal_path, "a")
+                except OSError as e:
+                    self.counters["errors"] += 1
+                    print(f"⚠ Session journal write failed: {e}")
+                    if log.closed:
+                        log = open(self.journal_path, "a")
+
+                if stopping:
+                    return
+        finally:
+            log.close()
+
+    def _compact(self):
+        """Write the journaled state to the snapshot and empty the journal"""
+        tmp_path = self.snapshot_path.with_name(SNAPSHOT_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"seq": self._seq, "sessions": self._sessions}, f, default=_encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(self.directory)
+        # Safe to drop: the snapshot now covers every record in the journal
+        with open(self.journal_path, "w") as f:
+            os.fsync(f.fileno())
+        self.counters["compactions"] += 1
@@ -0,0 +1,718 @@
+"""Named document collections for the Legal RAG Navigator.
+
+Each collection (e.g. one per state or per legal domain) lives in its own
+directory under ``DATA_DIR/collections`` with its own FAISS index, chunk store
+and stats, and is only loaded into memory the first time it is searched.
+
+Every build is written to a new, immutable ``versions/vNNNNNN`` directory and
+published by atomically replacing the collection's ``CURRENT`` pointer file.
+Running workers notice the new pointer on their next query and load the new
+version while in-flight queries finish on the snapshot they started with.
+The last INDEX_KEEP_VERSIONS versions are kept so a collection can be rolled
+back, and clearing a collection only unpublishes it. Bundles built offline
+by build_index.py are installed as versions that link to the bundle.
+Queries over several collections fan out over a thread pool (FAISS releases
+the GIL while searching) and the per-collection hits are merged into one top-k.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from diversify import Diversity, diversify
+from metadata_index import METADATA_INDEX_FILE, MetadataIndex, SearchFilters, id_selector
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "."))
+COLLECTIONS_DIR = DATA_DIR / "collections"
+DEFAULT_COLLECTION = "default"
+
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+VERSION_PATTERN = re.compile(r"^v\d{6}$")
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "5"))
+
+# flat keeps exact float32 vectors in the index; fp16 and sq8 are scalar
+# quantization to 2 and 1 bytes per dimension; pq is product quantization
+# (PQ_SUBQUANTIZERS bytes per vector) for large corpora.
+INDEX_ENCODINGS = ("flat", "fp16", "sq8", "pq")
+DEFAULT_INDEX_ENCODING = os.getenv("INDEX_ENCODING", "flat")
+# Each 8-bit sub-quantizer learns 256 centroids, and FAISS wants at least 39
+# training points per centroid
+PQ_NBITS = 8
+PQ_MIN_TRAINING_VECTORS = 39 * (1 << PQ_NBITS)
+
+# Compressed indexes fetch RESCORE_FACTOR * k candidates and re-rank them
+# against the memory-mapped float32 vectors in embeddings.npy.
+RESCORE_BY_DEFAULT = os.getenv("INDEX_RESCORE", "true").lower() in ("1", "true", "yes")
+RESCORE_FACTOR = int(os.getenv("INDEX_RESCORE_FACTOR", "4"))
+
+_search_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_THREADS", "4")),
+    thread_name_prefix="collection-search"
+)
+
+
+def make_chunk_id(collection_name: str, position: int, version: Optional[str] = None) -> str:
+    if version:
+        return f"{collection_name}@{version}:{position}"
+    return f"{collection_name}:{position}"
+
+
+def parse_chunk_id(chunk_id: str):
+    """Split a chunk ID into (collection name, position, version), or None if
+    malformed; version is None for IDs that refer to the current version"""
+    name, _, position = str(chunk_id).rpartition(":")
+    name, _, version = name.partition("@")
+    if not COLLECTION_NAME_PATTERN.match(name) or not position.isdigit():
+        return None
+    if version and not VERSION_PATTERN.match(version):
+        return None
+    return name, int(position), version or None
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    target = int(os.getenv("PQ_SUBQUANTIZERS", "0")) or max(1, dimension // 8)
+    # The number of sub-quantizers has to divide the vector dimension
+    while dimension % target:
+        target -= 1
+    return target
+
+
+def build_index(embeddings: np.ndarray, encoding: str = "flat"):
+    """Build a FAISS index storing vectors with the given encoding.
+
+    Returns the index and the encoding actually used: product quantization
+    falls back to sq8 when there are too few vectors to train its codebooks.
+    """
+    import faiss
+
+    if encoding not in INDEX_ENCODINGS:
+        raise ValueError(f"Unknown index encoding {encoding!r}; expected one of {', '.join(INDEX_ENCODINGS)}")
+    if encoding == "pq" and len(embeddings) < PQ_MIN_TRAINING_VECTORS:
+        print(f"⚠ {len(embeddings)} vectors are too few to train product quantization, using sq8")
+        encoding = "sq8"
+
+    dimension = embeddings.shape[1]
+    if encoding == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif encoding == "fp16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    elif encoding == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    else:
+        index = faiss.IndexPQ(dimension, _pq_subquantizers(dimension), PQ_NBITS)
+
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index, encoding
+
+
+def rescore_search(index, vectors: np.ndarray, q_embeddings: np.ndarray, k: int, params=None):
+    """Search a compressed index for RESCORE_FACTOR * k candidates and re-rank
+    them by exact squared L2 distance against the float32 vectors"""
+    _, candidates = index.search(q_embeddings, k * RESCORE_FACTOR, params=params)
+
+    distances = np.full((len(q_embeddings), k), np.inf, dtype="float32")
+    indices = np.full((len(q_embeddings), k), -1, dtype="int64")
+    for row, (query, ids) in enumerate(zip(q_embeddings, candidates)):
+        ids = np.sort(ids[ids >= 0])
+        exact = ((np.asarray(vectors[ids]) - query) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:k]
+        distances[row, :len(order)] = exact[order]
+        indices[row, :len(order)] = ids[order]
+    return distances, indices
+
+
+def subset_search(vectors: np.ndarray, ids: np.ndarray, q_embeddings: np.ndarray, k: int):
+    """Exact squared L2 search over the float32 vectors of the given IDs only"""
+    subset = np.asarray(vectors[ids], dtype="float32")
+    distances = np.full((len(q_embeddings), k), np.inf, dtype="float32")
+    indices = np.full((len(q_embeddings), k), -1, dtype="int64")
+    for row, query in enumerate(q_embeddings):
+        exact = ((subset - query) ** 2).sum(axis=1)
+        top = np.argpartition(exact, min(k, len(exact)) - 1)[:k] if len(exact) > k else np.arange(len(exact))
+        top = top[np.argsort(exact[top])]
+        distances[row, :len(top)] = exact[top]
+        indices[row, :len(top)] = ids[top]
+    return distances, indices
+
+
+def measure_recall(index, embeddings: np.ndarray, rescore: bool = False, k: int = 10, sample: int = 200) -> float:
+    """Recall@k of an index against exact search, using a sample of its own vectors as queries"""
+    import faiss
+
+    k = min(k, len(embeddings))
+    rng = np.random.default_rng(0)
+    queries = embeddings[rng.choice(len(embeddings), size=min(sample, len(embeddings)), replace=False)]
+
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+    if rescore:
+        _, found = rescore_search(index, embeddings, queries, k)
+    else:
+        _, found = index.search(queries, k)
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def _replace_file(path: Path, write):
+    """Write through a temporary file and rename it over path, so readers
+    (including memory maps of the old file) never see a partial write"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_vectors(path: Path, embeddings: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, embeddings)
+
+
+LoadedCollection = namedtuple("LoadedCollection", "version index chunks metadata vectors encoding meta_index")
+
+EMPTY_COLLECTION = LoadedCollection(None, None, [], [], None, "flat", None)
+
+# Files making up one version directory
+INDEX_FILE, DATA_FILE, VECTORS_FILE, STATS_FILE = "faiss_index", "vector_data.json", "embeddings.npy", "stats.json"
+# Offline-built bundles (see build_index.py) are a version directory plus a manifest
+MANIFEST_FILE = "manifest.json"
+BUNDLE_FORMAT = 1
+
+# Memory-map FAISS indexes instead of reading them into memory, so large
+# (e.g. prebuilt) indexes are ready at once and shared between workers
+INDEX_MMAP = os.getenv("INDEX_MMAP", "false").lower() in ("1", "true", "yes")
+
+
+def _load_version(version: str, path: Path) -> LoadedCollection:
+    import faiss
+
+    index = None
+    if INDEX_MMAP:
+        try:
+            index = faiss.read_index(str(path / INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"⚠ Could not memory-map {path / INDEX_FILE} ({e}), reading it instead")
+    if index is None:
+        index = faiss.read_index(str(path / INDEX_FILE))
+    with open(path / DATA_FILE, "r") as f:
+        data = json.load(f)
+    if (path / VECTORS_FILE).exists():
+        vectors = np.load(path / VECTORS_FILE, mmap_mode="r")
+    elif "embeddings" in data:
+        # Collections written before the float32 store kept vectors in the JSON
+        vectors = np.array(data["embeddings"], dtype="float32")
+    else:
+        vectors = None
+    stats = json.loads((path / STATS_FILE).read_text()) if (path / STATS_FILE).exists() else {}
+    if (path / METADATA_INDEX_FILE).exists():
+        meta_index = MetadataIndex.load(path / METADATA_INDEX_FILE)
+    else:
+        # Versions written before the metadata index
+        meta_index = MetadataIndex.build(data["metadata"], stats.get("updated_at") or datetime.now().isoformat())
+    return LoadedCollection(
+        version, index, data["chunks"], data["metadata"], vectors, stats.get("encoding", "flat"), meta_index
+    )
+
+
+def write_version_files(
+    directory: Path,
+    chunks: List[str],
+    metadata: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    embedding_model: Optional[str],
+    encoding: Optional[str] = None
+) -> Dict[str, Any]:
+    """Write the index, chunk store, vectors, metadata index and stats of one version, returning the stats"""
+    import faiss
+
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    index, encoding = build_index(embeddings, encoding or DEFAULT_INDEX_ENCODING)
+    # Chunks keep the time they were first uploaded across appends
+    updated_at = datetime.now().isoformat()
+    metadata = [meta if "uploaded_at" in meta else {**meta, "uploaded_at": updated_at} for meta in metadata]
+    meta_index = MetadataIndex.build(metadata, updated_at)
+
+    faiss.write_index(index, str(directory / INDEX_FILE))
+    _save_vectors(directory / VECTORS_FILE, embeddings)
+    (directory / DATA_FILE).write_text(json.dumps({"chunks": chunks, "metadata": metadata}))
+    meta_index.save(directory / METADATA_INDEX_FILE)
+
+    stats = {
+        "indexed": True,
+        "total_chunks": len(chunks),
+        "documents": sorted(name for name in meta_index.names if name != "Unknown"),
+        "dimension": int(embeddings.shape[1]),
+        "embedding_model": embedding_model,
+        "encoding": encoding,
+        "bytes_per_vector": round((directory / INDEX_FILE).stat().st_size / max(len(chunks), 1), 1),
+        "float32_bytes_per_vector": int(embeddings.shape[1]) * 4,
+        "updated_at": updated_at
+    }
+    if encoding != "flat":
+        stats["recall_at_10"] = measure_recall(index, embeddings)
+        stats["recall_at_10_rescored"] = measure_recall(index, embeddings, rescore=True)
+    (directory / STATS_FILE).write_text(json.dumps(stats))
+    return stats
+
+
+def write_bundle(directory: Path, manifest: Dict[str, Any], *args, **kwargs) -> Dict[str, Any]:
+    """Write a portable index bundle: the files of one version plus manifest.json.
+
+    Takes the arguments of write_version_files() and returns the manifest.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stats = write_version_files(directory, *args, **kwargs)
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "bundle_id": uuid.uuid4().hex,
+        "created_at": stats["updated_at"],
+        "embedding_model": stats["embedding_model"],
+        "dimension": stats["dimension"],
+        "encoding": stats["encoding"],
+        "total_chunks": stats["total_chunks"],
+        "documents": stats["documents"],
+        **manifest
+    }
+    _replace_file(directory / MANIFEST_FILE, lambda path: path.write_text(json.dumps(manifest, indent=2)))
+    return manifest
+
+
+def read_manifest(bundle_path: Path) -> Dict[str, Any]:
+    """Read a bundle's manifest, raising ValueError if the directory is not a complete bundle"""
+    bundle_path = Path(bundle_path)
+    if not (bundle_path / MANIFEST_FILE).exists():
+        raise ValueError(f"{bundle_path} is not an index bundle (no {MANIFEST_FILE})")
+    manifest = json.loads((bundle_path / MANIFEST_FILE).read_text())
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{bundle_path} has unsupported bundle format {manifest.get('format')!r}")
+    missing = [name for name in (INDEX_FILE, DATA_FILE, VECTORS_FILE, STATS_FILE) if not (bundle_path / name).exists()]
+    if missing:
+        raise ValueError(f"{bundle_path} is missing {', '.join(missing)}")
+    return manifest
+
+
+class Collection:
+    """A FAISS index, its chunk store and float32 vectors, loaded lazily and
+    reloaded when a new version is published"""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._loaded = EMPTY_COLLECTION
+
+    @property
+    def pointer_path(self) -> Path:
+        return self.path / "CURRENT"
+
+    @property
+    def versions_dir(self) -> Path:
+        return self.path / "versions"
+
+    def version_path(self, version: str) -> Path:
+        return self.versions_dir / version
+
+    @property
+    def current_path(self) -> Optional[Path]:
+        version = self.version()
+        return None if version is None else self.version_path(version)
+
+    def version(self) -> Optional[str]:
+        """The published version ID, or None if nothing is published"""
+        try:
+            return self.pointer_path.read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self) -> List[str]:
+        """Every complete version on disk, oldest first"""
+        if not self.versions_dir.exists():
+            return []
+        return sorted(entry.name for entry in self.versions_dir.iterdir() if VERSION_PATTERN.match(entry.name))
+
+    def exists(self) -> bool:
+        return self.version() is not None
+
+    def _state(self) -> LoadedCollection:
+        """The snapshot of the published version.
+
+        A snapshot is never modified once loaded, so a query keeps using the
+        one it started with. While one thread loads a newly published version
+        the others carry on serving the previous snapshot instead of waiting.
+        """
+        version = self.version()
+        loaded = self._loaded
+        if loaded.version == version:
+            return loaded
+        if version is None:
+            self._loaded = EMPTY_COLLECTION
+            return self._loaded
+
+        if not self._reload_lock.acquire(blocking=loaded.version is None):
+            return loaded
+        try:
+            if self._loaded.version != version:
+                self._loaded = _load_version(version, self.version_path(version))
+            return self._loaded
+        finally:
+            self._reload_lock.release()
+
+    def load(self):
+        """Return (index, chunks, metadata); (None, [], []) if nothing is indexed"""
+        state = self._state()
+        return state.index, state.chunks, state.metadata
+
+    def load_embeddings(self) -> Optional[np.ndarray]:
+        vectors = self._state().vectors
+        return None if vectors is None else np.array(vectors, dtype="float32")
+
+    def chunks_at(self, version: Optional[str]):
+        """Return (chunks, metadata) of a version (default: the published
+        one), or ([], []) if that version is no longer retained.
+
+        A version other than the loaded snapshot's is read from its chunk
+        store alone, without loading its FAISS index.
+        """
+        if version is not None and version != self._loaded.version:
+            return _read_chunk_store(self.version_path(version) / DATA_FILE)
+        state = self._state()
+        return state.chunks, state.metadata
+
+    def stats(self, version: Optional[str] = None) -> Dict[str, Any]:
+        version = version or self.version()
+        stats_path = None if version is None else self.version_path(version) / STATS_FILE
+        if stats_path is None or not stats_path.exists():
+            return {"indexed": False, "total_chunks": 0, "documents": []}
+        with open(stats_path, "r") as f:
+            return {**json.load(f), "version": version}
+
+    def write(
+        self,
+        chunks: List[str],
+        metadata: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        embedding_model: Optional[str],
+        encoding: Optional[str] = None
+    ) -> str:
+        """Build a new version from scratch and publish it, returning its ID"""
+        with self._write_lock:
+            return self._write_version(chunks, metadata, embeddings, embedding_model, encoding)
+
+    def append(
+        self,
+        chunks: List[str],
+        metadata: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        embedding_model: Optional[str],
+        encoding: Optional[str] = None
+    ) -> str:
+        """Publish a new version with the chunks added after the published
+        version's, returning its ID (default encoding: the published one's).
+
+        The published version is read under the write lock, so concurrent
+        appends each build on the other's version instead of dropping it.
+        Raises ValueError if the vectors have a different dimension.
+        """
+        with self._write_lock:
+            version = self.version()
+            if version is not None:
+                path = self.version_path(version)
+                with open(path / DATA_FILE, "r") as f:
+                    data = json.load(f)
+                if (path / VECTORS_FILE).exists():
+                    existing = np.load(path / VECTORS_FILE)
+                else:
+                    # Collections written before the float32 store kept vectors in the JSON
+                    existing = np.array(data["embeddings"], dtype="float32")
+                if existing.shape[1] != embeddings.shape[1]:
+                    raise ValueError(f"Collection '{self.name}' was built with a different embedding model")
+                chunks = data["chunks"] + chunks
+                metadata = data["metadata"] + metadata
+                embeddings = np.vstack([existing, embeddings])
+                encoding = encoding or self.stats(version).get("encoding")
+            return self._write_version(chunks, metadata, embeddings, embedding_model, encoding)
+
+    def _write_version(self, chunks, metadata, embeddings, embedding_model, encoding) -> str:
+        version = self._next_version()
+
+        # Build in a staging directory and rename it into place, so a
+        # version directory is always complete
+        staging = self.versions_dir / f".{version}.tmp"
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        write_version_files(staging, chunks, metadata, embeddings, embedding_model, encoding)
+
+        os.rename(staging, self.version_path(version))
+        self.publish(version)
+        self._prune()
+        return version
+
+    def _next_version(self) -> str:
+        existing = self.versions()
+        return f"v{int(existing[-1][1:]) + 1 if existing else 1:06d}"
+
+    def install_bundle(self, bundle_path: Path) -> Optional[str]:
+        """Publish a prebuilt bundle as a new version linked to the bundle directory.
+
+        Returns the new version ID, or None if this bundle is already one of
+        the collection's versions (it is then left as it is, so restarting a
+        server does not undo later uploads or rollbacks).
+        """
+        manifest = read_manifest(bundle_path)
+        with self._write_lock:
+            for version in self.versions():
+                installed = self.version_path(version) / MANIFEST_FILE
+                if installed.exists() and json.loads(installed.read_text()).get("bundle_id") == manifest["bundle_id"]:
+                    return None
+
+            version = self._next_version()
+            self.versions_dir.mkdir(parents=True, exist_ok=True)
+            os.symlink(Path(bundle_path).resolve(), self.version_path(version), target_is_directory=True)
+            self.publish(version)
+            self._prune()
+        return version
+
+    def publish(self, version: Optional[str]):
+        """Atomically point the collection at a retained version; None unpublishes it"""
+        if version is not None and version not in self.versions():
+            raise ValueError(f"Collection '{self.name}' has no version {version!r}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        _replace_file(self.pointer_path, lambda path: path.write_text(version or ""))
+
+    def _prune(self):
+        """Delete all but the newest INDEX_KEEP_VERSIONS versions, never the published one.
+
+        Snapshots already loaded keep working: the index is in memory and the
+        memory-mapped vectors stay readable after their file is unlinked.
+        """
+        current = self.version()
+        for version in self.versions()[:-INDEX_KEEP_VERSIONS or None]:
+            if version == current:
+                continue
+            if self.version_path(version).is_symlink():
+                # An installed bundle: drop the link, never the bundle itself
+                self.version_path(version).unlink()
+            else:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+    def clear(self):
+        """Unpublish the collection; its versions stay on disk for rollback"""
+        with self._write_lock:
+            if self.path.exists():
+                self.publish(None)
+
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        """Per-document chunk ID ranges, pages and upload time of the published version"""
+        meta_index = self._state().meta_index
+        return {} if meta_index is None else meta_index.documents()
+
+    def search(
+        self,
+        q_embeddings: np.ndarray,
+        k: int,
+        rescore: Optional[bool] = None,
+        filters: Optional[SearchFilters] = None,
+        with_vectors: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """Search with one query per row, returning the hits for each query.
+
+        Compressed indexes re-rank their candidates against the float32
+        vectors unless rescore is False (default: INDEX_RESCORE). Filters
+        restrict the search itself to the matching chunk IDs. with_vectors
+        adds each hit's float32 vector as "vector".
+        """
+        state = self._state()
+        mask = state.meta_index.mask(filters) if filters is not None and state.index is not None else None
+        if state.index is None or (mask is not None and not mask.any()):
+            return [[] for _ in range(len(q_embeddings))]
+
+        # bitmap backs the selector, so it has to stay referenced until the search is done
+        params, bitmap = None, None
+        if mask is not None and not mask.all():
+            import faiss
+
+            selector, bitmap = id_selector(mask)
+            params = faiss.SearchParameters(sel=selector)
+
+        rescore = RESCORE_BY_DEFAULT if rescore is None else rescore
+        if params is not None and state.encoding == "pq":
+            # IndexPQ does not take ID selectors; search the selected float32 vectors exactly
+            distances, indices = subset_search(state.vectors, np.flatnonzero(mask), q_embeddings, k)
+        elif rescore and state.encoding != "flat" and state.vectors is not None:
+            distances, indices = rescore_search(state.index, state.vectors, q_embeddings, k, params)
+        else:
+            distances, indices = state.index.search(q_embeddings, k, params=params)
+
+        results = [
+            [
+                {
+                    "chunk_id": make_chunk_id(self.name, int(position), state.version),
+                    "collection": self.name,
+                    "distance": float(distance),
+                    "content": state.chunks[position],
+                    "metadata": state.metadata[position]
+                }
+                for distance, position in zip(row_distances, row_indices)
+                if position >= 0
+            ]
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+        if with_vectors:
+            for row_hits, row_indices in zip(results, indices):
+                positions = row_indices[row_indices >= 0]
+                if state.vectors is not None:
+                    vectors = np.asarray(state.vectors[positions], dtype="float32")
+                else:
+                    vectors = np.stack([state.index.reconstruct(int(position)) for position in positions]) if len(positions) else []
+                for hit, vector in zip(row_hits, vectors):
+                    hit["vector"] = vector
+        return results
+
+
+@lru_cache(maxsize=8)
+def _read_chunk_store(path: Path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return [], []
+    return data["chunks"], data["metadata"]
+
+
+_collections: Dict[str, Collection] = {}
+_registry_lock = threading.Lock()
+
+
+def _migrate_unversioned_collection(collection: Collection):
+    """Move the files of a collection written before versioning into its first version"""
+    if collection.pointer_path.exists() or not (collection.path / INDEX_FILE).exists():
+        return
+
+    version = "v000001"
+    collection.version_path(version).mkdir(parents=True)
+    for filename in (INDEX_FILE, DATA_FILE, VECTORS_FILE, STATS_FILE):
+        if (collection.path / filename).exists():
+            os.replace(collection.path / filename, collection.version_path(version) / filename)
+    collection.publish(version)
+    print(f"Moved collection '{collection.name}' into version {version}")
+
+
+def _migrate_legacy_index(collection: Collection):
+    """Move a pre-collections faiss_index/vector_data.json pair into the default collection"""
+    legacy_index, legacy_data = DATA_DIR / "faiss_index", DATA_DIR / "vector_data.json"
+    if collection.exists() or not (legacy_index.exists() and legacy_data.exists()):
+        return
+
+    with open(legacy_data, "r") as f:
+        data = json.load(f)
+    collection.write(data["chunks"], data["metadata"], np.array(data["embeddings"], dtype="float32"), None, "flat")
+    legacy_index.unlink()
+    legacy_data.unlink()
+    print(f"Moved legacy index into collection '{collection.name}'")
+
+
+def get_collection(name: str = DEFAULT_COLLECTION) -> Collection:
+    """Return the named collection, raising ValueError for invalid names"""
+    if not COLLECTION_NAME_PATTERN.match(name or ""):
+        raise ValueError(f"Invalid collection name: {name!r}")
+
+    with _registry_lock:
+        collection = _collections.get(name)
+        if collection is None:
+            collection = Collection(name, COLLECTIONS_DIR / name)
+            _migrate_unversioned_collection(collection)
+            if name == DEFAULT_COLLECTION:
+                _migrate_legacy_index(collection)
+            _collections[name] = collection
+        return collection
+
+
+def find_collection(name: str) -> Optional[Collection]:
+    """Return the named collection if it already exists, without registering
+    one for names that only came from user input; raises ValueError for
+    invalid names"""
+    if not COLLECTION_NAME_PATTERN.match(name or ""):
+        raise ValueError(f"Invalid collection name: {name!r}")
+    if name not in _collections and name != DEFAULT_COLLECTION and not (COLLECTIONS_DIR / name).is_dir():
+        return None
+    return get_collection(name)
+
+
+def list_collections() -> List[str]:
+    names = {DEFAULT_COLLECTION}
+    if COLLECTIONS_DIR.exists():
+        names.update(
+            entry.name for entry in COLLECTIONS_DIR.iterdir()
+            if entry.is_dir() and COLLECTION_NAME_PATTERN.match(entry.name)
+        )
+    return sorted(names)
+
+
+def search_collections(
+    collections: List[Collection],
+    q_embeddings: np.ndarray,
+    k: int,
+    rescore: Optional[bool] = None,
+    filters: Optional[SearchFilters] = None,
+    diversity: Optional[Diversity] = None
+) -> List[List[Dict[str, Any]]]:
+    """Search every collection for the top k of each query row and merge the hits by distance.
+
+    With diversity, a larger candidate set is fetched and up to k diverse
+    hits are picked from it (see diversify.py).
+    """
+    diversified = diversity is not None and diversity.active()
+    fetch_k = max(k, diversity.candidates) if diversified else k
+    if len(collections) == 1:
+        merged = collections[0].search(q_embeddings, fetch_k, rescore, filters, diversified)
+    else:
+        futures = [
+            _search_pool.submit(collection.search, q_embeddings, fetch_k, rescore, filters, diversified)
+            for collection in collections
+        ]
+        per_collection = [future.result() for future in futures]
+
+        merged = []
+        for row in range(len(q_embeddings)):
+            hits = [hit for results in per_collection for hit in results[row]]
+            hits.sort(key=lambda hit: hit["distance"])
+            merged.append(hits[:fetch_k])
+
+    if diversified:
+        return [diversify(query, hits, k, diversity) for query, hits in zip(q_embeddings, merged)]
+    return merged
+
+
+def resolve_chunks(chunk_ids: List[str]) -> List[Dict[str, Any]]:
+    """Look chunk IDs up in their collections, skipping IDs that no longer resolve"""
+    resolved = []
+    for chunk_id in chunk_ids:
+        parsed = parse_chunk_id(chunk_id)
+        if parsed is None:
+            continue
+        name, position, version = parsed
+        collection = find_collection(name)
+        if collection is None:
+            continue
+        chunks, metadata = collection.chunks_at(version)
+        if position < len(chunks):
+            resolved.append({
+                "chunk_id": chunk_id,
+                "collection": name,
+                "content": chunks[position],
+                "metadata": metadata[position]
+            })
+    return resolved
@@ -0,0 +1,130 @@
+"""A pool of pre-created Watson Assistant sessions.
+
+Opening a Watson session takes two round trips (create the session, then an
+empty message for the welcome text). The pool keeps ``size`` sessions that
+have already been through both, so /session/create can hand one out at once.
+
+Watson ends sessions after a period of inactivity, so idle sessions older
+than ``max_age_seconds`` are replaced with fresh ones (and deleted) before
+that happens. A refill is triggered whenever a session is taken.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+WATSON_POOL_SIZE = int(os.getenv("WATSON_POOL_SIZE", "4"))
+# Watson's inactivity timeout is 5 minutes on the Lite and Plus plans.
+# Pooled sessions are replaced shortly before that; a session that still
+# expires before its first message is reopened by /chat
+WATSON_SESSION_MAX_AGE = float(os.getenv("WATSON_SESSION_MAX_AGE", "270"))
+# Watson bills every session opened without a user_id as a separate monthly
+# active user, so pooled sessions are all opened as this one user
+WATSON_POOL_USER_ID = os.getenv("WATSON_POOL_USER_ID", "session-pool")
+
+
+class PooledSession(NamedTuple):
+    watson_session_id: str
+    welcome_message: str
+    created_at: float
+
+
+class WatsonSessionPool:
+    def __init__(
+        self,
+        open_session: Callable[[], Tuple[str, str]],
+        close_session: Callable[[str], None],
+        size: int,
+        max_age_seconds: float
+    ):
+        # open_session and close_session are blocking and run in worker threads
+        self.open_session = open_session
+        self.close_session = close_session
+        self.size = size
+        self.max_age_seconds = max_age_seconds
+        self.welcome_message: Optional[str] = None
+        self._idle: Deque[PooledSession] = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"hits": 0, "misses": 0, "created": 0, "expired": 0, "errors": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def acquire(self) -> Optional[PooledSession]:
+        """Take the freshest idle session, or None if the pool is empty"""
+        now = time.monotonic()
+        while self._idle:
+            # Sessions are added on the left, so that end is the freshest
+            session = self._idle.popleft()
+            if now - session.created_at < self.max_age_seconds:
+                self.counters["hits"] += 1
+                self._wake.set()
+                return session
+            self._retire(session)
+        self.counters["misses"] += 1
+        self._wake.set()
+        return None
+
+    def replenish(self):
+        """Ask the pool to top itself up now"""
+        self._wake.set()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        idle, self._idle = list(self._idle), deque()
+        await asyncio.gather(
+            *(asyncio.to_thread(self.close_session, session.watson_session_id) for session in idle),
+            return_exceptions=True
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "idle": len(self._idle), **self.counters}
+
+    def _retire(self, session: PooledSession):
+        self.counters["expired"] += 1
+        asyncio.get_running_loop().run_in_executor(None, self._close_quietly, session.watson_session_id)
+
+    def _close_quietly(self, watson_session_id: str):
+        try:
+            self.close_session(watson_session_id)
+        except Exception:
+            pass
+
+    async def _open(self):
+        try:
+            watson_session_id, welcome_message = await asyncio.to_thread(self.open_session)
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"⚠ Could not pre-create a Watson session: {e}")
+            return False
+        self.welcome_message = welcome_message
+        self._idle.appendleft(PooledSession(watson_session_id, welcome_message, time.monotonic()))
+        self.counters["created"] += 1
+        return True
+
+    async def _run(self):
+        # Sessions are replaced a little before they would expire, so check
+        # several times per lifetime
+        interval = max(1.0, self.max_age_seconds / 4)
+        while True:
+            now = time.monotonic()
+            for session in [s for s in self._idle if now - s.created_at >= self.max_age_seconds]:
+                self._idle.remove(session)
+                self._retire(session)
+
+            # Cleared before refilling so a session taken meanwhile wakes the next round
+            self._wake.clear()
+            missing = self.size - len(self._idle)
+            if missing > 0:
+                results = await asyncio.gather(*(self._open() for _ in range(missing)))
+                if not all(results):
+                    # Watson is failing; back off instead of retrying in a tight loop
+                    await asyncio.sleep(interval)
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass